@@ -4,7 +4,7 @@ import logging
 from src.cogs.operations import OperationMacros
 
 import aiohttp
-from src import synchronization
+from src import bookmark, cache, synchronization, workers
 import traceback
 import asyncio
 from datetime import datetime
@@ -44,6 +44,8 @@ class Bot(commands.Bot):
     variant_handlers: VariantHandlers
     operation_macros: OperationMacros
     renderer: Renderer
+    render_pool: workers.RenderPool
+    bookmarks: bookmark.BookmarkClient
     def __init__(
         self, 
         command_prefix,
@@ -55,6 +57,8 @@ class Bot(commands.Bot):
         db_path: str, 
         instance_id: int,
         event_queue: asyncio.Queue[synchronization.CallbackEvent],
+        render_pool: workers.RenderPool,
+        bookmarks: bookmark.BookmarkClient,
         original_id: int,
         **kwargs
     ):
@@ -68,6 +72,8 @@ class Bot(commands.Bot):
         self.db_path = db_path
         self.instance_id = instance_id
         self.event_queue = event_queue
+        self.render_pool = render_pool
+        self.bookmarks = bookmarks
         self.original_id = original_id
         self.cog_names = cogs
         
@@ -129,6 +135,9 @@ bots: list[Bot] = []
 starters: list[Coroutine[Any, Any, int]] = []
 
 mpsc_queue = asyncio.Queue()
+# shared by every bot
+render_pool = workers.RenderPool(config.render_workers, config.db_path)
+bookmarks = bookmark.BookmarkClient(config.bookmark_url, ttl=config.bookmark_cache_ttl)
 
 async def shared_event_handler(event_queue: asyncio.Queue[synchronization.CallbackEvent]) -> int:
     while True:
@@ -146,45 +155,31 @@ async def shared_event_handler(event_queue: asyncio.Queue[synchronization.Callba
                 else:
                     for bot in bots:
                         await bot.reload_extension(cog)
+                # Workers keep running the code they were started with
+                render_pool.restart()
+                await callback()
+            elif isinstance(event, synchronization.TileDataRefreshEvent):
+                for bot in bots:
+                    await bot.db.load_tile_index()
+                # Prepared tiles depend on tile data, and sprite files may have been overwritten
+                cache.sprites.clear()
+                cache.missing_sprites.clear()
+                cache.ready_tiles.clear()
+                await asyncio.to_thread(cache.stored_renders.clear)
+                render_pool.restart()
+                await callback()
+            elif isinstance(event, synchronization.LetterDataRefreshEvent):
+                for bot in bots:
+                    await bot.db.load_letters()
+                # Seeded custom text is cached like other tiles
+                cache.ready_tiles.clear()
+                await asyncio.to_thread(cache.stored_renders.clear)
+                # Workers load the letters when they start
+                render_pool.restart()
                 await callback()
         except:
             traceback.print_exc()
 
-for i, token in enumerate(auth.tokens):
-    bot = Bot(
-        # Prefixes
-        commands.when_mentioned_or(*config.prefixes) if config.trigger_on_mention else config.prefixes,
-        # Other behavior parameters
-        case_insensitive=True, 
-        activity=discord.Game(name=config.activity), 
-        description=config.description,
-        # Never mention roles, @everyone or @here
-        allowed_mentions=discord.AllowedMentions(everyone=False, roles=False),
-        # Only receive message and reaction events
-        intents=discord.Intents(messages=True, reactions=True, guilds=True, message_content=True),
-        # Disable the member cache
-        member_cache_flags=discord.MemberCacheFlags.none(),
-        # Disable the message cache
-        max_messages=None,
-        # Don't chunk guilds
-        chunk_guilds_at_startup=False,
-        # for hot reloading
-        cogs=config.cogs,
-        embed_color=config.embed_color,
-        # display only
-        prefixes=config.prefixes,
-        db_path=config.db_path,
-        # synchronization
-        instance_id=i,
-        event_queue=mpsc_queue,
-        # logging
-        webhook_url=auth.webhook_url,
-        original_id=config.original_id
-    )
-    bots.append(bot)
-    starters.append(bot.start_with_exit_code(token))
-
-
 async def main() -> int:
     events = asyncio.create_task(shared_event_handler(mpsc_queue))
     tasks = [asyncio.create_task(starter) for starter in starters]
@@ -196,14 +191,55 @@ async def main() -> int:
     finally:
         print("Shutting down bots...")
         events.cancel()
+        render_pool.stop()
         await asyncio.gather(
             *(bot.close() for bot in bots if not bot.is_closed())
         )
 
-exit_code = 0
-try:
-    x = asyncio.run(main())
-except KeyboardInterrupt:
-    exit_code = 1
-finally:
-    exit(exit_code)
+# Worker processes import this module too, and must not start the bots
+if __name__ == "__main__":
+    for i, token in enumerate(auth.tokens):
+        bot = Bot(
+            # Prefixes
+            commands.when_mentioned_or(*config.prefixes) if config.trigger_on_mention else config.prefixes,
+            # Other behavior parameters
+            case_insensitive=True, 
+            activity=discord.Game(name=config.activity), 
+            description=config.description,
+            # Never mention roles, @everyone or @here
+            allowed_mentions=discord.AllowedMentions(everyone=False, roles=False),
+            # Only receive message and reaction events
+            intents=discord.Intents(messages=True, reactions=True, guilds=True, message_content=True),
+            # Disable the member cache
+            member_cache_flags=discord.MemberCacheFlags.none(),
+            # Disable the message cache
+            max_messages=None,
+            # Don't chunk guilds
+            chunk_guilds_at_startup=False,
+            # for hot reloading
+            cogs=config.cogs,
+            embed_color=config.embed_color,
+            # display only
+            prefixes=config.prefixes,
+            db_path=config.db_path,
+            # synchronization
+            instance_id=i,
+            event_queue=mpsc_queue,
+            render_pool=render_pool,
+            bookmarks=bookmarks,
+            # logging
+            webhook_url=auth.webhook_url,
+            original_id=config.original_id
+        )
+        bots.append(bot)
+        starters.append(bot.start_with_exit_code(token))
+
+    render_pool.start(wait=True)
+
+    exit_code = 0
+    try:
+        x = asyncio.run(main())
+    except KeyboardInterrupt:
+        exit_code = 1
+    finally:
+        exit(exit_code)
@@ -7,6 +7,9 @@ trigger_on_mention = True
 embed_color = discord.Color(9077635)
 log_file = "log.txt"
 db_path = "robot.db"
+render_workers = 2
+bookmark_url = "https://baba-is-bookmark.herokuapp.com"
+bookmark_cache_ttl = 24 * 60 * 60
 original_id = 480227663047294987
 cogs = [
     "src.cogs.owner",
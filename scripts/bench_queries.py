@@ -0,0 +1,102 @@
+'''Times the level search lookups, the guild counts and a bulk insert of tiles.
+
+Usage, from the root of the repository: `python scripts/bench_queries.py [database]`.
+The database defaults to `config.db_path`. It is never modified: the benchmark runs on a
+copy of it in a temporary directory, with synthetic levels and guilds added so that the
+lookups have enough rows to search. Run it before and after a schema change to compare.
+'''
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db import Database
+
+# The lookups made by the level search, with arguments that match the synthetic levels
+QUERIES: dict[str, tuple[str, tuple]] = {
+    "level by name": ("SELECT * FROM levels WHERE name == ?", ("further fields",)),
+    "level by parent-map_id": ("SELECT * FROM levels WHERE LOWER(parent) == LOWER(?) AND UNLIKELY(map_id == ?)", ("map7", "3")),
+    "map by map_id": ("SELECT * FROM levels WHERE LOWER(map_id) == LOWER(?) AND parent IS NULL", ("map5",)),
+    "level by id": ("SELECT * FROM levels WHERE id == ?", ("16level",)),
+    "guild count per bot": ("SELECT COUNT(*) FROM guilds WHERE bot_id == ?", (0,)),
+}
+REPEATS = 200
+WORLDS = 40
+LEVELS_PER_WORLD = 500
+GUILDS = 5000
+TILES = 2000
+
+def populate(path: str) -> None:
+    '''Adds synthetic levels to a copy of the database.'''
+    conn = sqlite3.connect(path)
+    rng = random.Random(1)
+    conn.execute(
+        '''CREATE TABLE IF NOT EXISTS levels (
+            id TEXT NOT NULL, world TEXT NOT NULL, name TEXT NOT NULL, subtitle TEXT, number INTEGER,
+            style INTEGER, parent TEXT, map_id TEXT, UNIQUE(id, world)
+        );'''
+    )
+    levels = [
+        (
+            f"{i}level", f"world{w}", f"level name {w} {i}", None, rng.randrange(20), 0,
+            # Every 25th level is a map holding the 24 levels after it
+            None if i % 25 == 0 else f"map{i // 25}",
+            f"map{i // 25}" if i % 25 == 0 else None,
+        )
+        for w in range(WORLDS) for i in range(LEVELS_PER_WORLD)
+    ]
+    levels.append(("200level", "baba", "further fields", None, 3, 0, "space", None))
+    conn.executemany("INSERT OR IGNORE INTO levels VALUES (?, ?, ?, ?, ?, ?, ?, ?);", levels)
+    conn.commit()
+    conn.close()
+
+async def bench(path: str) -> None:
+    db = Database()
+    start = time.perf_counter()
+    await db.connect(path)
+    print(f"{'connect':24} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    conn = db.conn
+    await conn.executemany("INSERT OR IGNORE INTO guilds VALUES (?, ?);", [(10**12 + i, i % 3) for i in range(GUILDS)])
+
+    for name, (sql, args) in QUERIES.items():
+        plan = await conn.fetchall("EXPLAIN QUERY PLAN " + sql, *args)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            await conn.fetchall(sql, *args)
+        elapsed = (time.perf_counter() - start) / REPEATS
+        print(f"{name:24} {elapsed * 1000:8.3f} ms  {' / '.join(row[3] for row in plan)}")
+
+    rows = [(f"bench_{i}", "bench", "baba", 0, 0, 0, 0, 0, -1, 0, None, "") for i in range(TILES)]
+    start = time.perf_counter()
+    await conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", rows)
+    print(f"{f'insert {TILES} tiles':24} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    pragmas = [
+        f"{pragma}={(await conn.fetchone(f'PRAGMA {pragma};'))[0]}"
+        for pragma in ("journal_mode", "synchronous", "user_version")
+    ]
+    print(" ".join(pragmas))
+    await db.close()
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        source = sys.argv[1]
+    else:
+        import config
+        source = config.db_path
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        shutil.copy(source, path)
+        populate(path)
+        asyncio.run(bench(path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import os
+import time
+from typing import Any
+
+import aiohttp
+
+from . import cache
+
+class BookmarkClient:
+    '''Fetches custom levels from Baba Is Bookmark.
+
+    Requests go through the session of the bot making them. Concurrent requests for the same
+    level are shared, and downloaded levels are cached on disk in `cache_dir` for `ttl` seconds.
+    Expired files are deleted when a level is stored, at most once every `ttl` seconds.
+    '''
+    def __init__(self, base_url: str, *, cache_dir: str = "cache/levels", ttl: float = 24 * 60 * 60) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        # When expired files were last deleted
+        self.pruned_at = 0.0
+        self.flights: cache.SingleFlight[tuple[str, str], Any] = cache.SingleFlight()
+
+    async def _get_json(self, session: aiohttp.ClientSession, endpoint: str, code: str, *, strict: bool) -> Any | None:
+        '''Requests a level endpoint of the API.
+
+        If `strict` is set, raises aiohttp.ClientResponseError on an error status.
+        Otherwise, returns None on any status other than 200 or 304.
+        '''
+        async with session.get(f"{self.base_url}/api/level/{endpoint}", params={"code": code.upper()}) as resp:
+            if strict:
+                resp.raise_for_status()
+            elif resp.status not in (200, 304):
+                return None
+            return await resp.json()
+
+    def _cache_paths(self, code: str) -> tuple[str, str]:
+        path = f"{self.cache_dir}/{code.lower()}"
+        return path + ".l", path + ".ld"
+
+    def _cached(self, code: str) -> tuple[bytes, str] | None:
+        '''The level files cached for a code, if they haven't expired'''
+        l_path, ld_path = self._cache_paths(code)
+        try:
+            if time.time() - os.path.getmtime(ld_path) > self.ttl:
+                return None
+            with open(l_path, "rb") as l_fp, open(ld_path, encoding="utf-8") as ld_fp:
+                return l_fp.read(), ld_fp.read()
+        except OSError:
+            return None
+
+    def _store(self, code: str, raw_l: bytes, raw_ld: str) -> None:
+        '''Caches the level files of a code. Errors writing the files are ignored.'''
+        # The .ld file is written last, its modification time marks the entry as complete
+        l_path, ld_path = self._cache_paths(code)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(l_path + ".tmp", "wb") as fp:
+                fp.write(raw_l)
+            os.replace(l_path + ".tmp", l_path)
+            with open(ld_path + ".tmp", "w", encoding="utf-8") as fp:
+                fp.write(raw_ld)
+            os.replace(ld_path + ".tmp", ld_path)
+        except OSError:
+            # Downloaded again next time
+            pass
+        if time.time() - self.pruned_at > self.ttl:
+            self.pruned_at = time.time()
+            self._prune()
+
+    def _prune(self) -> None:
+        '''Deletes the cached files that have expired'''
+        now = time.time()
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    async def exists(self, session: aiohttp.ClientSession, code: str) -> bool:
+        '''Whether a level with the given code exists. False if the site didn't respond properly.'''
+        if self._cached(code) is not None:
+            return True
+        data = await self.flights.run(("exists", code.lower()), lambda: self._get_json(session, "exists", code, strict=False))
+        return data is not None and bool(data["data"]["exists"])
+
+    async def level(self, session: aiohttp.ClientSession, code: str) -> tuple[bytes, str]:
+        '''The raw .l and .ld files of a level. Raises aiohttp.ClientResponseError on a bad response.'''
+        cached = self._cached(code)
+        if cached is not None:
+            return cached
+        return await self.flights.run(("level", code.lower()), lambda: self._fetch_level(session, code))
+
+    async def _fetch_level(self, session: aiohttp.ClientSession, code: str) -> tuple[bytes, str]:
+        # Both files are downloaded at the same time
+        l_data, ld_data = await asyncio.gather(
+            self._get_json(session, "raw/l", code, strict=True),
+            self._get_json(session, "raw/ld", code, strict=True),
+        )
+        raw_l = base64.b64decode(l_data["data"])
+        raw_ld = ld_data["data"]
+        # Blocks on disk I/O
+        await asyncio.to_thread(self._store, code, raw_l, raw_ld)
+        return raw_l, raw_ld
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from PIL import Image
+
+from . import constants
+
+if TYPE_CHECKING:
+    from .db import CustomLevelData
+    from .text_layout import TextLayout
+    from .workers import RenderResult
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+T = TypeVar("T")
+
+class LRUCache(Generic[K, V]):
+    '''A least-recently-used cache, bounded by the total size of its values.
+
+    `sizeof` measures the size of a value. By default every value has a size
+    of 1, which bounds the cache by its number of entries.
+    '''
+    def __init__(self, max_size: int, *, sizeof: Callable[[V], int] = lambda _: 1) -> None:
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.entries: OrderedDict[K, tuple[V, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.entries
+
+    def get(self, key: K) -> V | None:
+        '''Returns the cached value and marks it as recently used, or None on a miss.'''
+        try:
+            value, _ = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        '''Caches a value, evicting the least recently used values if the cache is full.
+
+        Values larger than the cache itself are not stored.
+        '''
+        size = self.sizeof(value)
+        if key in self.entries:
+            _, old_size = self.entries.pop(key)
+            self.size -= old_size
+        if size > self.max_size:
+            return
+        self.entries[key] = value, size
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        '''Empties the cache. The counters are kept.'''
+        self.entries.clear()
+        self.size = 0
+
+    def summary(self) -> str:
+        '''Human-readable statistics'''
+        return (
+            f"{len(self.entries)} entries ({self.size}/{self.max_size}), "
+            f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+        )
+
+class SingleFlight(Generic[K, T]):
+    '''Shares the result of a call between concurrent callers with the same key.
+
+    While a call is running, callers with the same key wait for it instead of starting
+    their own. Nothing is kept once it has finished.
+    '''
+    def __init__(self) -> None:
+        self.in_flight: dict[K, asyncio.Task[T]] = {}
+        self.shared = 0
+
+    async def run(self, key: K, fn: Callable[[], Awaitable[T]]) -> T:
+        '''Runs `fn()`, unless a call with the same key is running, in which case its result is shared.'''
+        task = self.in_flight.get(key)
+        if task is None:
+            task = self.in_flight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        # One caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+class DiskCache:
+    '''A least-recently-used cache of files in a directory, bounded by their total size.
+
+    Keys are relative paths. The directory is only scanned when the cache is first used,
+    and files are ordered by their modification time, which is updated on every hit.
+
+    Every method blocks on disk I/O, so they should be called from a thread, with
+    `asyncio.to_thread`. They can be called from several threads at once.
+    '''
+    def __init__(self, path: str, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[str, int] | None = None
+        # Guards the entries and the counters. Files are read and written outside of it
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _scan(self) -> OrderedDict[str, int]:
+        if self.entries is None:
+            found = []
+            for root, _, files in os.walk(self.path):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    full = os.path.join(root, name)
+                    try:
+                        stat = os.stat(full)
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime_ns, os.path.relpath(full, self.path), stat.st_size))
+            found.sort()
+            self.entries = OrderedDict((key, size) for _, key, size in found)
+            self.size = sum(self.entries.values())
+            self._evict()
+        return self.entries
+
+    def _evict(self) -> None:
+        assert self.entries is not None
+        while self.size > self.max_size:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.path, key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> bytes | None:
+        '''Returns the cached file contents and marks them as recently used, or None on a miss.'''
+        with self.lock:
+            if key not in self._scan():
+                self.misses += 1
+                return None
+        path = os.path.join(self.path, key)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+            os.utime(path)
+        except OSError:
+            # Removed by something else
+            with self.lock:
+                entries = self._scan()
+                if key in entries:
+                    self.size -= entries.pop(key)
+                self.misses += 1
+            return None
+        with self.lock:
+            entries = self._scan()
+            if key in entries:
+                entries.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        '''Caches file contents, evicting the least recently used files if the cache is full.
+
+        Contents larger than the cache itself are not stored. Errors writing the file are ignored.
+        '''
+        if len(data) > self.max_size:
+            return
+        path = os.path.join(self.path, key)
+        # Written to a temporary file first so that a partial file is never read
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as fp:
+                fp.write(data)
+        except OSError:
+            return
+        with self.lock:
+            try:
+                os.replace(temp_path, path)
+            except OSError:
+                # Cleared while it was being written
+                return
+            entries = self._scan()
+            if key in entries:
+                self.size -= entries.pop(key)
+            entries[key] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def clear(self) -> None:
+        '''Deletes every cached file. The counters are kept.'''
+        with self.lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.entries = OrderedDict()
+            self.size = 0
+
+    def summary(self) -> str:
+        '''Human-readable statistics'''
+        with self.lock:
+            entries = self._scan()
+            return (
+                f"{len(entries)} files ({self.size}/{self.max_size}), "
+                f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+            )
+
+def image_size(img: Image.Image) -> int:
+    '''Approximate size of a decoded image in bytes'''
+    return img.width * img.height * len(img.getbands())
+
+SpriteKey = tuple[str, str, Optional[int], Optional[int]]
+
+# Decoded RGBA sprites, shared by every bot instance in the process
+sprites: LRUCache[SpriteKey, Image.Image] = LRUCache(constants.SPRITE_CACHE_SIZE, sizeof=image_size)
+# Sprites that don't exist. Looking up a sprite often tries several files before one is found
+missing_sprites: LRUCache[SpriteKey, bool] = LRUCache(constants.MISSING_SPRITE_CACHE_SIZE)
+
+# Fully prepared (recolored, filtered) frames of tiles, keyed by every option that affects them
+ready_tiles: LRUCache[Hashable, tuple[Image.Image, Image.Image, Image.Image]] = LRUCache(
+    constants.READY_TILE_CACHE_SIZE,
+    sizeof=lambda frames: sum(map(image_size, frames))
+)
+
+# Recently rendered scenes, keyed by a digest of their render job, with the time they expire at
+renders: LRUCache[str, tuple[float, RenderResult]] = LRUCache(
+    constants.RENDER_CACHE_SIZE,
+    sizeof=lambda entry: len(entry[1].gif) + len(entry[1].extra or b"")
+)
+
+# Renders that come out the same every time, kept across restarts
+stored_renders = DiskCache("cache/renders", constants.RENDER_DISK_CACHE_SIZE)
+
+# Renders and custom levels being made right now, shared by every bot instance in the process
+render_flights: SingleFlight[str, RenderResult] = SingleFlight()
+custom_level_flights: SingleFlight[str, CustomLevelData] = SingleFlight()
+
+# Layouts of custom text, keyed by the text, its mode and the widths its letters come in
+text_layouts: LRUCache[tuple[str, str, tuple[tuple[int, ...], ...]], TextLayout] = LRUCache(constants.TEXT_LAYOUT_CACHE_SIZE)
+
+def sprite_path(source: str, sprite: str, variant: int | None, wobble: int | None) -> str:
+    '''The path of a sprite file.
+
+    `variant` and `wobble` are omitted from the file name if None.
+    '''
+    path = f"data/sprites/{source}/{sprite}"
+    if variant is not None:
+        path += f"_{variant}"
+    if wobble is not None:
+        path += f"_{wobble}"
+    return path + ".png"
+
+def open_sprite(source: str, sprite: str, variant: int | None, wobble: int | None) -> Image.Image:
+    '''Opens a sprite as RGBA, going through the sprite cache. Raises FileNotFoundError on failure.
+
+    The returned image is shared between callers, and must not be modified in place.
+    '''
+    key = source, sprite, variant, wobble
+    img = sprites.get(key)
+    if img is None:
+        path = sprite_path(source, sprite, variant, wobble)
+        if missing_sprites.get(key):
+            raise FileNotFoundError(path)
+        try:
+            with Image.open(path) as fp:
+                img = fp.convert("RGBA")
+        except FileNotFoundError:
+            missing_sprites.put(key, True)
+            raise
+        sprites.put(key, img)
+    return img
+
+# Parsed data files, shared by every bot instance in the process.
+# Path -> (modification time, size, parser digest), parsed data
+_parsed: dict[str, tuple[tuple[int, int, str], Any]] = {}
+
+def _code_digest(code: CodeType) -> str:
+    '''A digest of what a function does, which stays the same while its code does'''
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        digest.update((_code_digest(const) if isinstance(const, CodeType) else repr(const)).encode())
+    return digest.hexdigest()
+
+def parsed_file(path: str, parse: Callable[[str], T]) -> T:
+    '''Parses a text file, going through a cache in memory.
+
+    The file is only parsed again when it changes, or when the code of `parse` does.
+    `parse` must return plain data, that doesn't depend on any class that could be reloaded.
+    '''
+    # Changing the parser invalidates what it parsed before
+    stat = os.stat(path)
+    key = stat.st_mtime_ns, stat.st_size, _code_digest(parse.__code__)
+    cached = _parsed.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, errors="replace", encoding="utf-8") as fp:
+        value = parse(fp.read())
+    _parsed[path] = key, value
+    return value
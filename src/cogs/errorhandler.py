@@ -8,6 +8,7 @@ from typing import TYPE_CHECKING
 import discord
 from discord.ext import commands
 
+from .. import errors
 from ..constants import MAXIMUM_GUILD_THRESHOLD
 from ..types import Context
 
@@ -160,6 +161,10 @@ class CommandErrorHandler(commands.Cog):
                 return await ctx.error("This action cannot be performed.")
             return await ctx.error("There was an error while processing this action.")
         
+        elif isinstance(error, errors.WorkerCrashed):
+            await self.webhook.send(embed=emb)
+            return await ctx.error("The renderer crashed while working on this. Try something smaller.")
+
         # All other Errors not returned come here... And we can just print the default TraceBack + log
         await ctx.error(f"An exception occurred: {type(error)}\n{error}\n```{''.join(traceback.format_tb(error.__traceback__))}```")
         await self.webhook.send(embed=emb)
@@ -23,6 +23,7 @@ from .. import constants, errors
 from ..db import CustomLevelData, LevelData
 from ..tile import RawTile
 from ..types import Context
+from ..workers import RenderJob
 
 if TYPE_CHECKING:
     from ...ROBOT import Bot
@@ -160,6 +161,7 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
             r"(?:^|\s)(?:--letter|-l)(?:$|\s)",
             r"(?:^|\s)(?:(--delay=|-d=)(\d+))(?:$|\s)",
             r"(?:^|\s)(?:(--frames=|-f=)(\d))(?:$|\s)",
+            r"(?:^|\s)(?:(--seed=|-s=)(\d{1,18}))(?:$|\s)",
         )
         background = None
         for match in re.finditer(flag_patterns[0], tiles):
@@ -194,6 +196,10 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
             frame_count = int(match.group(2))
             if frame_count < 1 or frame_count > 3:
                 return await ctx.error(f"The frame count must be 1, 2 or 3.")
+        # Custom text comes out the same every time, unless another seed is given
+        seed = 0
+        for match in re.finditer(flag_patterns[6], tiles):
+            seed = int(match.group(2))
         
         # Clean up
         for pattern in flag_patterns:
@@ -459,10 +465,8 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
         
         try:
             # Handles variants based on `:` affixes
-            buffer = BytesIO()
-            extra_buffer = BytesIO() if raw_output else None
             extra_names = [] if raw_output else None
-            full_objects = await self.bot.variant_handlers.handle_grid(
+            full_objects = self.bot.variant_handlers.handle_grid(
                 expanded_tiles,
                 (width, height),
                 raw_output=raw_output,
@@ -474,30 +478,26 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
                     raw_name = extra_names[0]
                 else:
                     raw_name = constants.DEFAULT_RENDER_ZIP_NAME
-            full_tiles = await self.bot.renderer.render_full_tiles(
+            job = RenderJob(
                 full_objects,
-                palette=palette,
-                random_animations=True
-            )
-            await self.bot.renderer.render(
-                full_tiles,
                 grid_size=(width, height),
                 duration=duration,
                 palette=palette,
-                background=background, 
-                out=buffer,
+                background=background,
                 delay=delay,
                 frame_count=frame_count,
                 upscale=not raw_output,
-                extra_out=extra_buffer,
-                extra_name=raw_name,
+                random_animations=True,
+                extra_name=raw_name if raw_output else None,
+                seed=seed,
             )
+            result = await self.bot.render_pool.render(self.bot.renderer, job)
         except errors.TileNotFound as e:
             word = e.args[0]
             name = word.name
-            if word.name.startswith("tile_") and await self.bot.db.tile(name[5:]) is not None:
+            if word.name.startswith("tile_") and self.bot.db.tile(name[5:]) is not None:
                 return await ctx.error(f"The tile `{name}` could not be found. Perhaps you meant `{name[5:]}`?")
-            if await self.bot.db.tile("text_" + name) is not None:
+            if self.bot.db.tile("text_" + name) is not None:
                 return await ctx.error(f"The tile `{name}` could not be found. Perhaps you meant `{'text_' + name}`?")
             return await ctx.error(f"The tile `{name}` could not be found.")
         except errors.BadTileProperty as e:
@@ -518,8 +518,9 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
         filename = datetime.utcnow().strftime(r"render_%Y-%m-%d_%H.%M.%S.gif")
         delta = time() - start
         msg = f"*Rendered in {delta:.2f} s*"
-        if extra_buffer is not None and raw_name:
-            extra_buffer.seek(0)
+        buffer = BytesIO(result.gif)
+        if result.extra is not None and raw_name:
+            extra_buffer = BytesIO(result.extra)
             await ctx.reply(content=f'{msg}\n*Raw files:*', files=[discord.File(extra_buffer, filename=f"{raw_name}.zip"),discord.File(buffer, filename=filename, spoiler=spoiler)])
         else:
             await ctx.reply(content=msg, file=discord.File(buffer, filename=filename, spoiler=spoiler))
@@ -539,6 +540,7 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
         * `--letter` (`-L`): Enables letter mode. Custom text that has 2 letters in it will be rendered in "letter" mode.
         * `--delay=<...>` (`-D=<...>`): Alter the delay (in milliseconds) between frames.
         * `--frames=<...>` (`-F=<...>`): How many wobble frames will be shown? (1, 2 or 3)
+        * `--seed=<...>` (`-S=<...>`): Pick other letters for custom text. Custom text looks the same every time it's rendered, unless another seed is given. The same seed always picks the same letters.
         
         **Variants, Operations & Transformations**
         * `:variant`: Append `:variant` to a tile to change color or sprite of a tile. See the `variants` command for more.
@@ -576,6 +578,7 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
         * `--letter` (`-L`): Enables letter mode. Custom text that has 2 letters in it will be rendered in "letter" mode.
         * `--delay=<...>` (`-D=<...>`): Alter the delay (in milliseconds) between frames.
         * `--frames=<...>` (`-F=<...>`): How many wobble frames will be shown? (1, 2 or 3)
+        * `--seed=<...>` (`-S=<...>`): Pick other letters for custom text. Custom text looks the same every time it's rendered, unless another seed is given. The same seed always picks the same letters.
 
         **Variants**
         * `:variant`: Append `:variant` to a tile to change color or sprite of a tile. See the `variants` command for more.
@@ -890,17 +893,14 @@ class GlobalCog(commands.Cog, name="Baba Is You"):
                 # Expensive operation 
                 await ctx.reply("Searching for custom level... this might take a while", mention_author=False)
                 await ctx.typing()
-                async with aiohttp.request("GET", f"https://baba-is-bookmark.herokuapp.com/api/level/exists?code={fine_query.upper()}") as resp:
-                    if resp.status in (200, 304):
-                        data = await resp.json()
-                        if data["data"]["exists"]:
-                            try:
-                                custom_level = await self.bot.get_cog("Reader").render_custom_level(fine_query)
-                            except ValueError as e:
-                                size = e.args[0]
-                                return await ctx.error(f"The level code is valid, but the level's width, height or area is way too big ({size})!")
-                            except aiohttp.ClientResponseError as e:
-                                return await ctx.error(f"The Baba Is Bookmark site returned a bad response. Try again later.")
+                if await self.bot.bookmarks.exists(self.bot.session, fine_query):
+                    try:
+                        custom_level = await self.bot.get_cog("Reader").render_custom_level(fine_query)
+                    except ValueError as e:
+                        size = e.args[0]
+                        return await ctx.error(f"The level code is valid, but the level's width, height or area is way too big ({size})!")
+                    except aiohttp.ClientResponseError as e:
+                        return await ctx.error(f"The Baba Is Bookmark site returned a bad response. Try again later.")
         if custom_level is None:
             levels = await self.search_levels(fine_query)
             if len(levels) == 0:
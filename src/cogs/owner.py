@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import collections
 import configparser
 import itertools
@@ -13,10 +14,10 @@ from typing import TYPE_CHECKING, Any, Optional
 
 import discord
 from discord.ext import commands
-from PIL import Image, ImageChops, ImageDraw
-from src import constants, synchronization
+from src import cache, constants, synchronization
 
 from ..db import TileData
+from ..letters import LetterJob, read_ready_letters, scrape_letters
 from ..types import Context
 
 if TYPE_CHECKING:
@@ -123,8 +124,13 @@ class OwnerCog(commands.Cog, name="Admin", command_attrs=dict(hidden=True)):
         await self.load_initial_tiles()
         await self.load_editor_tiles()
         await self.load_custom_tiles()
-        self.bot.loading = False
-        return await ctx.send("Done. Loaded all tile data.")
+
+        @synchronization.TileDataRefreshEvent()
+        async def callback():
+            self.bot.loading = False
+            await ctx.send("Done. Loaded all tile data.")
+
+        await self.bot.request(callback)
 
     async def load_initial_tiles(self):
         '''Loads tile data from `data/values.lua` and `.ld` files.'''
@@ -491,8 +497,11 @@ class OwnerCog(commands.Cog, name="Admin", command_attrs=dict(hidden=True)):
     @commands.command()
     @commands.is_owner()
     async def loadletters(self, ctx: Context):
-        '''Scrapes individual letters from vanilla sprites.'''
+        '''Scrapes individual letters from vanilla sprites, replacing the letters loaded before.'''
         ignored = json.load(open("config/letterignore.json"))
+        # Background plates for type-2 text, in 1 bit per pixel depth
+        plates = [self.bot.db.plate(None, i)[0].getchannel("A").convert("1") for i in range(3)]
+        jobs = []
         for row in await self.bot.db.conn.fetchall(
             f'''
             SELECT * FROM tiles
@@ -503,163 +512,32 @@ class OwnerCog(commands.Cog, name="Admin", command_attrs=dict(hidden=True)):
         ):
             data = TileData.from_row(row)
             if data.sprite not in ignored:
-                await self.load_letter(
-                    data.sprite, 
-                    data.text_type # type: ignore
-                )
-
-        await self.load_ready_letters()
-
-        await ctx.send("Letters loaded.")
-
-    async def load_letter(self, word: str, tile_type: int):
-        '''Scrapes letters from a sprite.'''
-        chars = word[5:] # Strip "text_" prefix
-
-        # Get the number of rows
-        two_rows = len(chars) >= 4
-
-        # Background plates for type-2 text,
-        # in 1 bit per pixel depth
-        plates = [self.bot.db.plate(None, i)[0].getchannel("A").convert("1") for i in range(3)]
-        
-        # Maps each character to three bounding boxes + images
-        # (One box + image for each frame of animation)
-        # char_pos : [((x1, y1, x2, y2), Image), ...]
-        char_sizes: dict[tuple[int, str], Any] = {}
-        
-        # Scrape the sprites for the sprite characters in each of the three frames
-        for i, plate in enumerate(plates):
-            # Get the alpha channel in 1-bit depth
-            alpha = Image.open(f"data/sprites/{constants.BABA_WORLD}/{word}_0_{i + 1}.png") \
-                .convert("RGBA") \
-                .getchannel("A") \
-                .convert("1")
-            
-            # Type-2 text has inverted text on a background plate
-            if tile_type == 2:
-                alpha = ImageChops.invert(alpha)
-                alpha = ImageChops.logical_and(alpha, plate)
-
-
-            # Get the point from which characters are seeked for
-            x = 0
-            y = 6 if two_rows else 12
-
-            # Flags
-            skip = False
-            
-            # More than 1 bit per pixel is required for the flood fill
-            alpha = alpha.convert("L")
-            for i, char in enumerate(chars):
-                if skip:
-                    skip = False
-                    continue
-
-                while alpha.getpixel((x, y)) == 0:
-                    if x == alpha.width - 1:
-                        if two_rows and y == 6:
-                            x = 0
-                            y = 18
-                        else:
-                            break
-                    else:
-                        x += 1
-                # There's a letter at this position
-                else:
-                    clone = alpha.copy()
-                    ImageDraw.floodfill(clone, (x, y), 128) # 1 placeholder
-                    clone = Image.eval(clone, lambda x: 255 if x == 128 else 0)
-                    clone = clone.convert("1")
-                    
-                    # Get bounds of character blob 
-                    x1, y1, x2, y2 = clone.getbbox() # type: ignore
-                    # Run some checks
-                    # # Too wide => Skip 2 characters (probably merged two chars)
-                    # if x2 - x1 > (1.5 * alpha.width * (1 + two_rows) / len(chars)):
-                    #     skip = True
-                    #     alpha = ImageChops.difference(alpha, clone)
-                    #     continue
-                    
-                    # Too tall? Scrap the rest of the characters
-                    if y2 - y1 > 1.5 * alpha.height / (1 + two_rows):
-                        break
-
-                    # too thin! bad letter.
-                    if x2 - x1 <= 2:
-                        alpha = ImageChops.difference(alpha, clone)
-                        continue
-                    
-                    # Remove character from sprite, push to char_sizes
-                    alpha = ImageChops.difference(alpha, clone)
-                    clone = clone.crop((x1, y1, x2, y2))
-                    entry = ((x1, y1, x2, y2), clone)
-                    char_sizes.setdefault((i, char), []).append(entry)
-                    continue
-                return
-
-        results = []
-        for (_, char), entries in char_sizes.items():
-            # All three frames clearly found the character in the sprite
-            if len(entries) == 3:
-                x1_min = min(entries, key=lambda x: x[0][0])[0][0]
-                y1_min = min(entries, key=lambda x: x[0][1])[0][1]
-                x2_max = max(entries, key=lambda x: x[0][2])[0][2]
-                y2_max = max(entries, key=lambda x: x[0][3])[0][3]
-
-                blobs = []
-                mode = "small" if two_rows else "big"
-                width = 0
-                height = 0
-                for i, ((x1, y1, _, _), img) in enumerate(entries):
-                    frame = Image.new("1", (x2_max - x1_min, y2_max - y1_min))
-                    frame.paste(img, (x1 - x1_min, y1 - y1_min))
-                    width, height = frame.size
-                    buf = BytesIO()
-                    frame.save(buf, format="PNG")
-                    blobs.append(buf.getvalue())
-                results.append((mode, char, width, *blobs))
+                jobs.append(LetterJob(data.sprite, data.text_type, plates))
+        paths = [str(path) for path in pathlib.Path("data/letters").glob("*/*/*/*_0.png")]
+        chunks = [paths[i:i + 16] for i in range(0, len(paths), 16)]
+
+        # Sprites are scraped in the worker processes, without blocking the bot
+        pool = self.bot.render_pool
+        results = await asyncio.gather(
+            *(pool.call(scrape_letters, job) for job in jobs),
+            *(pool.call(read_ready_letters, chunk) for chunk in chunks)
+        )
+        rows = [row for result in results for row in result]
+        async with self.bot.db.conn.transaction():
+            await self.bot.db.conn.execute("DELETE FROM letters;")
+            await self.bot.db.conn.executemany(
+                '''
+                INSERT INTO letters
+                VALUES (?, ?, ?, ?, ?, ?);
+                ''',
+                rows
+            )
 
-        await self.bot.db.conn.executemany(
-            '''
-            INSERT INTO letters
-            VALUES (?, ?, ?, ?, ?, ?);
-            ''',
-            results
-        )   
-
-    async def load_ready_letters(self):
-        def channel_shenanigans(im: Image.Image) -> Image.Image:
-            if im.mode == "1":
-                return im
-            elif im.mode == "RGB" or im.mode == "L":
-                return im.convert("1")
-            return im.convert("RGBA").getchannel("A").convert("1")
-        data = []
-        for path in pathlib.Path("data/letters").glob("*/*/*/*_0.png"):
-            _, _, mode, char, w, name = path.parts
-            char = char.replace("asterisk", "*")
-            width = int(w)
-            prefix = name[:-6]
-            # mo ch w h
-            buf_0 = BytesIO()
-            channel_shenanigans(Image.open(path)).save(buf_0, format="PNG")
-            blob_0 = buf_0.getvalue()
-            buf_1 = BytesIO()
-            channel_shenanigans(Image.open(path.parent / f"{prefix}_1.png")).save(buf_1, format="PNG")
-            blob_1 = buf_1.getvalue()
-            buf_2 = BytesIO()
-            channel_shenanigans(Image.open(path.parent / f"{prefix}_2.png")).save(buf_2, format="PNG")
-            blob_2 = buf_2.getvalue()
-            data.append((mode, char, width, blob_0, blob_1, blob_2))
+        @synchronization.LetterDataRefreshEvent()
+        async def callback():
+            await ctx.send(f"Loaded {len(rows)} letters.")
 
-        await self.bot.db.conn.executemany(
-            '''
-            INSERT INTO letters
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''',
-            data
-        )
+        await self.bot.request(callback)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: discord.Guild):
@@ -730,6 +608,12 @@ class OwnerCog(commands.Cog, name="Admin", command_attrs=dict(hidden=True)):
         ]
         for row in bots:
             out.append(f"[{row[0]}]: {row[1]}")
+        # Render workers keep their own sprite and tile caches, which aren't counted here
+        where = "bot process only" if self.bot.render_pool.executor is not None else "all renders"
+        out.append(f"Sprite cache ({where}): {cache.sprites.summary()}")
+        out.append(f"Tile cache ({where}): {cache.ready_tiles.summary()}")
+        out.append(f"Render cache: {cache.renders.summary()}, {cache.render_flights.shared} shared renders")
+        out.append(f"Stored renders: {await asyncio.to_thread(cache.stored_renders.summary)}")
         await ctx.send("\n".join(out))
 
     @commands.command(aliases=["previewzip", "showzip"])
@@ -767,7 +651,12 @@ class OwnerCog(commands.Cog, name="Admin", command_attrs=dict(hidden=True)):
         })
         with open(f"data/custom/{pack_name}.json", "w") as f:
             json.dump(sprite_data, f, indent=4)
-        await ctx.send(f"Added {sprite_name}.")
+
+        @synchronization.TileDataRefreshEvent()
+        async def callback():
+            await ctx.send(f"Added {sprite_name}.")
+
+        await self.bot.request(callback)
 
     @commands.command()
     @commands.is_owner()
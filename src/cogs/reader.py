@@ -1,28 +1,28 @@
 from __future__ import annotations
 
 import asyncio
-import base64
-import configparser
+import hashlib
 import io
 import json
 import os
 import re
 import zlib
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from os import listdir
-from typing import TYPE_CHECKING, Any, BinaryIO, TextIO
+from typing import TYPE_CHECKING, Any, BinaryIO, Literal, TextIO
 
-import aiohttp
 import numpy as np
 from discord.ext import commands
 from PIL import Image
 from src import constants
 from src.db import CustomLevelData, LevelData
-from src.utils import cached_open
 
-from .. import tile
+from .. import cache, tile
+from ..ld import LevelFile
+from ..recolor import recolor_batch
 from ..tile import ReadyTile
 from ..types import Context
+from ..workers import LevelJob, LevelResult
 
 if TYPE_CHECKING:
     from ...ROBOT import Bot
@@ -32,6 +32,88 @@ def flatten(x: int, y: int, width: int) -> int:
     '''Return the flattened position of a coordinate in a grid of specified width'''
     return int(y) * width + int(x)
 
+def file_digest(path: str) -> str | None:
+    '''The SHA-256 digest of a file's contents, or None if it doesn't exist'''
+    try:
+        with open(path, "rb") as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def parse_objects(data: str) -> list[dict[str, Any]]:
+    '''Parses the objects in the contents of a values.lua file, as the fields of their `Item`s.'''
+    start = data.find("tileslist =\n")
+    end = data.find("\n}\n", start)
+
+    assert start > 0 and end > 0
+    spanned = data[start:end]
+
+    object_pattern = re.compile(
+        r"(object\d+) =\n\t\{"
+        r"\n.*"
+        r"\n\s*sprite = \"([^\"]*)\","
+        r"\n.*\n.*\n\s*tiling = (-1|\d),"
+        r"\n.*"
+        r"\n\s*(?:argextra = .*,\n\s*)?(?:argtype = .*,\n\s*)?"
+        r"colour = \{(\d), (\d)\},"
+        r"(?:\n\s*active = \{(\d), (\d)\},)?"
+        r"\n\s*tile = \{(\d+), (\d+)\},"
+        r"\n.*"
+        r"\n\s*layer = (\d+),"
+        r"\n\s*\}",
+    )
+    objects = []
+    for match in re.finditer(object_pattern, spanned):
+        obj, sprite, tiling, c_x, c_y, a_x, a_y, t_x, t_y, layer = match.groups()
+        if a_x is None or a_y is None:
+            color = int(c_x), int(c_y)
+        else:
+            color = int(a_x), int(a_y)
+        objects.append(dict(
+            obj=obj,
+            layer=int(layer),
+            id=(int(t_y) << 8) | int(t_x),
+            sprite=sprite,
+            tiling=int(tiling),
+            color=color
+        ))
+    return objects
+
+def read_manifest(source: str) -> dict[str, Any]:
+    '''Reads the manifest of the levels rendered in `target/renders/<source>/`.
+
+    The manifest maps each level to the job it was rendered with, the version of the
+    renderer, and the result of that job, including the digests of its input files.
+    '''
+    try:
+        with open(f"target/renders/{source}/manifest.json") as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_manifest(source: str, manifest: dict[str, Any]):
+    '''Writes the manifest of the levels rendered in `target/renders/<source>/`.'''
+    with open(f"target/renders/{source}/manifest.json", "w") as fp:
+        json.dump(manifest, fp)
+
+def manifest_entry(job: LevelJob, result: LevelResult, version: str) -> dict[str, Any]:
+    '''The manifest entry of a level rendered by the given version of the renderer'''
+    return {
+        "job": [job.initialize, job.remove_borders, job.keep_background],
+        "version": version,
+        "metadata": asdict(result.metadata),
+        "parent_level": result.parent_level,
+        "inputs": result.inputs,
+    }
+
+def manifest_result(entry: dict[str, Any]) -> LevelResult:
+    '''The result of rendering a level, from its manifest entry'''
+    parent_level = None
+    if entry["parent_level"] is not None:
+        map_id, child_levels = entry["parent_level"]
+        parent_level = map_id, {child: tuple(node) for child, node in child_levels.items()}
+    return LevelResult(LevelData(**entry["metadata"]), parent_level, entry["inputs"])
+
 class Grid:
     '''This stores the information of a single Baba level, in a format readable by the renderer.'''
     def __init__(self, filename: str, world: str):
@@ -58,77 +140,145 @@ class Grid:
         self.number: int | None = None
         # Custom levels
         self.author: str | None = None
+        # Paths of the files that the level's render depends on,
+        # including files that were looked for but don't exist
+        self.inputs: set[str] = set()
     
+    def arrays(self) -> GridArrays:
+        '''Returns the objects of the grid as parallel arrays, in the order they're drawn in.'''
+        items = [(pos, item) for pos, cell in enumerate(self.cells) for item in cell]
+        sprite_indices: dict[str, int] = {}
+        pos = np.array([pos for pos, _ in items], dtype=np.int64)
+        layer = np.array([item.layer for _, item in items], dtype=np.int64)
+        # Row by row, then by layer. Objects on the same layer keep their order
+        order = np.lexsort((np.arange(len(items)), layer, pos))
+        items = [items[i][1] for i in order.tolist()]
+        pos = pos[order]
+        return GridArrays(
+            x=pos % self.width if self.width else pos,
+            y=pos // self.width if self.width else pos,
+            id=np.array([item.id for item in items], dtype=np.int64),
+            sprite=np.array([sprite_indices.setdefault(item.sprite, len(sprite_indices)) for item in items], dtype=np.int64),
+            sprites=list(sprite_indices),
+            direction=np.array([item.direction for item in items], dtype=np.int64),
+            layer=layer[order],
+            color=np.array([item.color for item in items], dtype=np.int64).reshape(-1, 2),
+            tiling=np.array([item.tiling for item in items], dtype=np.int64),
+        )
+
+    def occupancy(self, arrays: GridArrays, sprites: np.ndarray) -> np.ndarray:
+        '''Returns a bitmap of the cells that objects of each of the given sprites connect to.
+
+        Objects connect to objects of the same sprite, edges, levels and the border of the grid.
+        The bitmaps are padded by one cell on every side, which also counts as connected.
+        '''
+        height, width = self.height, self.width
+        occupied = np.zeros((len(arrays.sprites), height, width), dtype=bool)
+        occupied[arrays.sprite, arrays.y, arrays.x] = True
+        connected = np.zeros((height, width), dtype=bool)
+        for sprite in ("edge", "level"):
+            if sprite in arrays.sprites:
+                connected |= occupied[arrays.sprites.index(sprite)]
+        bitmaps = np.ones((len(sprites), height + 2, width + 2), dtype=bool)
+        # Every cell except those on the border of the grid
+        bitmaps[:, 2:-2, 2:-2] = (occupied[sprites] | connected)[:, 1:-1, 1:-1]
+        return bitmaps
+
     def ready_grid(self, *, remove_borders: bool) -> tile.Grid[ReadyTile]:
         '''Returns a ready-to-paste version of the grid.'''
-        def is_adjacent(sprite: str, x: int, y: int) -> bool:
-            valid = (sprite, "edge", "level")
-            if x == 0 or x == self.width - 1:
-                return True
-            if y == 0 or y == self.height - 1:
-                return True
-            return any(item.sprite in valid for item in self.cells[y * self.width + x])
-        
-        def open_sprite(world: str, sprite: str, variant: int, wobble: int, *, cache: dict[str, Image.Image]) -> Image.Image:
+        def open_sprite(world: str, sprite: str, variant: int, wobble: int) -> Image.Image:
             '''This first checks the given world, then the `baba` world, then `baba-extensions`, and if both fail it returns `default`'''
-            if sprite == "icon":
-                path = f"data/sprites/{{}}/icon.png"
-            elif sprite.startswith("icon_default"):
-                path = f"data/sprites/{{}}/{sprite}.png"
+            key_variant: int | None = variant
+            key_wobble: int | None = wobble
+            if sprite == "icon" or sprite.startswith("icon_default"):
+                key_variant = key_wobble = None
             elif sprite in ("smiley", "hi") or sprite.startswith("icon"):
-                path = f"data/sprites/{{}}/{sprite}_1.png"
+                key_variant, key_wobble = None, 1
             elif sprite == "default":
-                path = f"data/sprites/{{}}/default_{wobble}.png"
-            else:
-                path = f"data/sprites/{{}}/{sprite}_{variant}_{wobble}.png"
+                key_variant = None
             
             for maybe_world in (world, constants.BABA_WORLD, constants.EXTENSIONS_WORLD):
+                self.inputs.add(cache.sprite_path(maybe_world, sprite, key_variant, key_wobble))
                 try:
-                    return cached_open(path.format(maybe_world), cache=cache, fn=Image.open).convert("RGBA")
+                    return cache.open_sprite(maybe_world, sprite, key_variant, key_wobble)
                 except FileNotFoundError:
                     continue
             else:
-                return cached_open(f"data/sprites/{constants.BABA_WORLD}/default_{wobble}.png", cache=cache, fn=Image.open).convert("RGBA")
-            
-        def recolor(sprite: Image.Image, rgb: tuple[int, int, int]) -> Image.Image:
-            '''Apply rgb color multiplication (0-255)'''
-            r,g,b = rgb
-            arr = np.asarray(sprite, dtype='float64')
-            arr[..., 0] *= r / 256
-            arr[..., 1] *= g / 256
-            arr[..., 2] *= b / 256
-            return Image.fromarray(arr.astype('uint8'))
+                self.inputs.add(cache.sprite_path(constants.BABA_WORLD, "default", None, wobble))
+                return cache.open_sprite(constants.BABA_WORLD, "default", None, wobble)
         
-        sprite_cache = {}
-        grid = {}
-        palette_img = Image.open(f"data/palettes/{self.palette}.png").convert("RGB")
-        for y in range(self.height):
-            for x in range(self.width):
-                if remove_borders and (x == 0 or y == 0 or x == self.width - 1 or y == self.height - 1):
-                    continue
-                for item in sorted(self.cells[y * self.width + x], key=lambda item: item.layer):
-                    item: Item
-                    if item.tiling in constants.DIRECTION_TILINGS:
-                        variant = item.direction * 8
-                    elif item.tiling in constants.AUTO_TILINGS:
-                        variant = (
-                            is_adjacent(item.sprite, x + 1, y) * 1 +
-                            is_adjacent(item.sprite, x, y - 1) * 2 +
-                            is_adjacent(item.sprite, x - 1, y) * 4 +
-                            is_adjacent(item.sprite, x, y + 1) * 8
-                        )
-                    else:
-                        variant = 0
-                    color = palette_img.getpixel(item.color)
-                    frames = (
-                        recolor(open_sprite(self.world, item.sprite, variant, 1, cache=sprite_cache), color),
-                        recolor(open_sprite(self.world, item.sprite, variant, 2, cache=sprite_cache), color),
-                        recolor(open_sprite(self.world, item.sprite, variant, 3, cache=sprite_cache), color),
-                    )
-                    grid.setdefault((x - 1, y - 1, 0), []).append(ReadyTile(frames))
+        arrays = self.arrays()
+        xs, ys = arrays.x, arrays.y
+        if remove_borders:
+            shown = (xs > 0) & (ys > 0) & (xs < self.width - 1) & (ys < self.height - 1)
+        else:
+            shown = np.ones(len(xs), dtype=bool)
+
+        variants = np.zeros(len(xs), dtype=np.int64)
+        directional = np.isin(arrays.tiling, list(constants.DIRECTION_TILINGS))
+        variants[directional] = arrays.direction[directional] * 8
+        auto = np.isin(arrays.tiling, list(constants.AUTO_TILINGS)) & ~directional
+        if auto.any():
+            auto_sprites, which = np.unique(arrays.sprite[auto], return_inverse=True)
+            bitmaps = self.occupancy(arrays, auto_sprites)
+            # Positions in the padded bitmaps are offset by one
+            x, y = xs[auto] + 1, ys[auto] + 1
+            variants[auto] = (
+                bitmaps[which, y, x + 1] * 1 +
+                bitmaps[which, y - 1, x] * 2 +
+                bitmaps[which, y, x - 1] * 4 +
+                bitmaps[which, y + 1, x] * 8
+            )
 
+        self.inputs.add(f"data/palettes/{self.palette}.png")
+        palette = np.asarray(Image.open(f"data/palettes/{self.palette}.png").convert("RGB"))
+        rgbs = palette[arrays.color[:, 1], arrays.color[:, 0]]
+
+        # Sprites are collected first and recolored in bulk at the end.
+        # Identical objects share their recolored frames
+        positions: list[tuple[tuple[int, int, int], int]] = []
+        unique: dict[tuple[int, int, tuple[int, int, int]], int] = {}
+        sprites: list[Image.Image] = []
+        colors: list[tuple[int, int, int]] = []
+        indices = np.flatnonzero(shown)
+        for x, y, sprite, variant, rgb in zip(
+            xs[indices].tolist(),
+            ys[indices].tolist(),
+            arrays.sprite[indices].tolist(),
+            variants[indices].tolist(),
+            map(tuple, rgbs[indices].tolist()),
+        ):
+            key = sprite, variant, rgb
+            i = unique.get(key)
+            if i is None:
+                i = unique[key] = len(unique)
+                for wobble in (1, 2, 3):
+                    sprites.append(open_sprite(self.world, arrays.sprites[sprite], variant, wobble))
+                    colors.append(rgb)
+            positions.append(((x - 1, y - 1, 0), i))
+
+        recolored = recolor_batch(sprites, colors)
+        tiles = [(f0, f1, f2) for f0, f1, f2 in zip(recolored[0::3], recolored[1::3], recolored[2::3])]
+        grid = {}
+        for position, i in positions:
+            grid.setdefault(position, []).append(ReadyTile(tiles[i]))
         return grid
 
+@dataclass
+class GridArrays:
+    '''The objects of a level as parallel arrays, one element per object'''
+    x: np.ndarray
+    y: np.ndarray
+    id: np.ndarray
+    # Indices into `sprites`
+    sprite: np.ndarray
+    sprites: list[str]
+    direction: np.ndarray
+    layer: np.ndarray
+    # Palette coordinates, (N, 2)
+    color: np.ndarray
+    tiling: np.ndarray
+
 @dataclass
 class Item:
     '''Represents an object within a level with metadata.
@@ -188,18 +338,16 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
         self.read_objects()
         
     async def render_custom_level(self, code: str) -> CustomLevelData:
-        '''Renders a custom level. code should be valid (but is checked regardless)'''
-        async with aiohttp.request("GET", f"https://baba-is-bookmark.herokuapp.com/api/level/raw/l?code={code.upper()}") as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            b64 = data["data"]
-            decoded = base64.b64decode(b64)
-            raw_l = io.BytesIO(decoded)
-        async with aiohttp.request("GET", f"https://baba-is-bookmark.herokuapp.com/api/level/raw/ld?code={code.upper()}") as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            raw_s = data["data"]
-            raw_ld = io.StringIO(raw_s)
+        '''Renders a custom level. code should be valid (but is checked regardless)
+
+        Concurrent requests for the same level share one render.
+        '''
+        return await cache.custom_level_flights.run(code.lower(), lambda: self._render_custom_level(code))
+
+    async def _render_custom_level(self, code: str) -> CustomLevelData:
+        l_bytes, ld_text = await self.bot.bookmarks.level(self.bot.session, code)
+        raw_l = io.BytesIO(l_bytes)
+        raw_ld = io.StringIO(ld_text)
 
         grid = self.read_map(code, source="levels", data=raw_l)
         grid = await self.read_metadata(grid, data=raw_ld, custom=True)
@@ -229,24 +377,20 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
 
         return data
 
-    async def render_level(
-        self, 
-        filename: str, 
-        source: str, 
-        initialize: bool = False, 
-        remove_borders: bool = False, 
-        keep_background: bool = False, 
-    ) -> LevelData:
+    async def bake_level(self, job: LevelJob) -> LevelResult:
         '''Loads and renders a level, given its file path and source. 
         Shaves off the borders if specified.
+
+        Returns the level's metadata, its node in the level tree and the digests of its input files.
         '''
+        remove_borders = job.remove_borders
         # Data
-        grid = self.read_map(filename, source=source)
-        grid = await self.read_metadata(grid, initialize_level_tree=initialize)
+        grid = self.read_map(job.filename, source=job.source)
+        grid = await self.read_metadata(grid, initialize_level_tree=job.initialize)
         objects = grid.ready_grid(remove_borders=remove_borders)
 
         # (0,4) is the color index for level backgrounds
-        background = (0,4) if keep_background else None
+        background = (0,4) if job.keep_background else None
 
         # Render the level
         await self.bot.renderer.render(
@@ -260,20 +404,24 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
             out=f"target/renders/{grid.world}/{grid.filename}.gif",
         )
         # Return level metadata
-        return LevelData(filename, source, grid.name, grid.subtitle, grid.number, grid.style, grid.parent, grid.map_id)
+        return LevelResult(
+            LevelData(job.filename, job.source, grid.name, grid.subtitle, grid.number, grid.style, grid.parent, grid.map_id),
+            self.parent_levels.pop(job.filename, None),
+            {path: job.digests[path] if path in job.digests else file_digest(path) for path in sorted(grid.inputs)},
+        )
 
     @commands.command(name="loadmap")
     @commands.is_owner()
     async def load_map(self, ctx: Context, source: str, filename: str):
         '''Loads a given level's image.'''
         # Parse and render
-        await self.render_level(
-            filename, 
-            source=source, 
-            initialize=False, 
+        await self.bot.render_pool.bake_level(self, LevelJob(
+            filename,
+            source=source,
+            initialize=False,
             remove_borders=True,
             keep_background=True,
-        )
+        ))
         # This should mostly just be false
         await ctx.send(f"Rendered level at `{source}/{filename}`.")
 
@@ -319,20 +467,28 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
 
     @commands.command(name="loadworld")
     @commands.is_owner()
-    async def load_world(self, ctx: Context, world: str = constants.BABA_WORLD, also_mobile: bool = True):
+    async def load_world(
+        self,
+        ctx: Context,
+        world: str = constants.BABA_WORLD,
+        also_mobile: bool = True,
+        force: Literal["--force"] | None = None
+    ):
         '''Loads and renders levels in a world and its mobile variant.
         Initializes the level tree unless otherwise specified.
         Cuts off borders from rendered levels unless otherwise specified.
+        Levels whose files haven't changed since they were last rendered are skipped, unless `--force` is given.
         '''
         await ctx.send("Loading maps...")
-        total = await self.load_single_world(ctx, world, also_mobile=also_mobile)
+        total = await self.load_single_world(ctx, world, also_mobile=also_mobile, force=force is not None)
         await ctx.send(f"{total}/{total} maps loaded. Database updated.")
     
     @commands.command(name="loadallworlds")
     @commands.is_owner()
-    async def load_all_worlds(self, ctx: Context):
+    async def load_all_worlds(self, ctx: Context, force: Literal["--force"] | None = None):
         '''NUCLEAR COMMAND!
         PLEASE DON'T USE IT UNLESS YOU NEED TO RE-RENDER EVERY PACK.
+        Levels whose files haven't changed since they were last rendered are skipped, unless `--force` is given.
         '''
         await ctx.send("Loading maps from every single world...")
         with open("data/levelpacks.json") as f:
@@ -340,87 +496,109 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
         pack_names = ["baba"] + list(packs.keys())
         for world in pack_names:
             await ctx.send(f"Loading maps for `{world}`...")
-            total = await self.load_single_world(ctx, world, also_mobile=True)
+            total = await self.load_single_world(ctx, world, also_mobile=True, force=force is not None)
             await ctx.send(f"{total}/{total} maps loaded for `{world}`.")
         await ctx.reply("Loaded all worlds. Updated the database.")
 
-    async def load_single_world(self, ctx: Context, world: str, *, also_mobile: bool) -> int:
+    async def load_single_world(self, ctx: Context, world: str, *, also_mobile: bool, force: bool = False) -> int:
         # Parse and render the level map
         levels = [l[:-2] for l in listdir(f"data/levels/{world}") if l.endswith(".l")]
         try:
             os.mkdir(f"target/renders/{world}")
         except FileExistsError:
             pass
-        metadatas = {}
         total = len(levels)
-        for i,level in enumerate(levels):
-            metadata = await self.render_level(
+        done = 0
+        unchanged_count = 0
+
+        sources = [world, f"{world}_m"] if also_mobile else [world]
+        old_manifests = {source: {} if force else read_manifest(source) for source in sources}
+        manifests: dict[str, dict[str, Any]] = {source: {} for source in sources}
+        # Levels rendered by other code are rendered again
+        version = self.bot.render_pool.version
+        # Input files are shared between many levels. Every level reads values.lua
+        values_digest = file_digest("data/values.lua")
+        digests: dict[str, str | None] = {"data/values.lua": values_digest}
+
+        def unchanged(job: LevelJob) -> LevelResult | None:
+            '''The previous result of a job, if none of its inputs have changed since'''
+            entry = old_manifests[job.source].get(job.filename)
+            if entry is None or entry["job"] != [job.initialize, job.remove_borders, job.keep_background]:
+                return None
+            if entry.get("version") != version:
+                return None
+            if not os.path.isfile(f"target/renders/{job.source}/{job.filename}.gif"):
+                return None
+            for path, digest in entry["inputs"].items():
+                if path not in digests:
+                    digests[path] = file_digest(path)
+                if digests[path] != digest:
+                    return None
+            manifests[job.source][job.filename] = entry
+            return manifest_result(entry)
+
+        async def bake(job: LevelJob) -> LevelResult:
+            nonlocal unchanged_count
+            result = unchanged(job)
+            if result is not None:
+                unchanged_count += 1
+                return result
+            result = await self.bot.render_pool.bake_level(self, job)
+            manifests[job.source][job.filename] = manifest_entry(job, result, version)
+            return result
+
+        async def bake_all(level: str) -> tuple[str, LevelResult]:
+            nonlocal done
+            result = await bake(LevelJob(
                 level,
-                source=world, 
-                initialize=True, 
+                source=world,
+                initialize=True,
                 remove_borders=True,
                 keep_background=True,
-            )
+                digests={"data/values.lua": values_digest},
+            ))
             if also_mobile:
                 try:
-                    await self.render_level(
+                    await bake(LevelJob(
                         level,
-                        source=f"{world}_m", 
-                        initialize=False, 
+                        source=f"{world}_m",
+                        initialize=False,
                         remove_borders=True,
                         keep_background=True,
-                    )
+                        digests={"data/values.lua": values_digest},
+                    ))
                 except FileNotFoundError:
                     pass
-            metadatas[level] = metadata
-            await asyncio.sleep(0)
-            if i and i % 50 == 0:
-                await ctx.send(f"{i}/{total}")
+            done += 1
+            if done % 50 == 0:
+                await ctx.send(f"{done}/{total}")
+            return level, result
+
+        # Levels are rendered in parallel by the render workers
+        results = dict(await asyncio.gather(*(bake_all(level) for level in levels)))
+        for source, manifest in manifests.items():
+            if os.path.isdir(f"target/renders/{source}"):
+                write_manifest(source, manifest)
+        if unchanged_count:
+            await ctx.send(f"Skipped {unchanged_count} unchanged levels.")
+        metadatas = {}
+        # Build the level tree in a consistent order
+        for level in levels:
+            result = results[level]
+            metadatas[level] = result.metadata
+            if result.parent_level is not None:
+                self.parent_levels[level] = result.parent_level
         await self.clean_metadata(metadatas)
         return total
 
     def read_objects(self) -> None:
-        '''Inner function that parses the contents of the data/values.lua file.
+        '''Inner function that populates the default objects from the data/values.lua file.
+        The file is only parsed again when it changes.
         '''
-        with open("data/values.lua", errors="replace") as fp:
-            data = fp.read()
-        
-        start = data.find("tileslist =\n")
-        end = data.find("\n}\n", start)
-
-        assert start > 0 and end > 0
-        spanned = data[start:end]
-
-        object_pattern = re.compile(
-            r"(object\d+) =\n\t\{"
-            r"\n.*"
-            r"\n\s*sprite = \"([^\"]*)\","
-            r"\n.*\n.*\n\s*tiling = (-1|\d),"
-            r"\n.*"
-            r"\n\s*(?:argextra = .*,\n\s*)?(?:argtype = .*,\n\s*)?"
-            r"colour = \{(\d), (\d)\},"
-            r"(?:\n\s*active = \{(\d), (\d)\},)?"
-            r"\n\s*tile = \{(\d+), (\d+)\},"
-            r"\n.*"
-            r"\n\s*layer = (\d+),"
-            r"\n\s*\}",
-        )
-        for match in re.finditer(object_pattern, spanned):
-            obj, sprite, tiling, c_x, c_y, a_x, a_y, t_x, t_y, layer = match.groups()
-            if a_x is None or a_y is None:
-                color = int(c_x), int(c_y)
-            else:
-                color = int(a_x), int(a_y)
-            item = Item(
-                obj=obj,
-                layer=int(layer),
-                id=(int(t_y) << 8) | int(t_x),
-                sprite=sprite,
-                tiling=int(tiling),
-                color=color
-            )
+        for fields in cache.parsed_file("data/values.lua", parse_objects):
+            item = Item(**fields)
             self.defaults_by_id[item.id] = item
-            self.defaults_by_object[obj] = item
+            self.defaults_by_object[item.obj] = item
             self.defaults_by_name[item.sprite] = item
         # We've parsed and stored all objects from data/values.lua in cache.
         # Now we only need to add the special cases:
@@ -434,13 +612,18 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
         self.defaults_by_object[level.obj] = level
         self.defaults_by_id[level.id] = level
         self.defaults_by_name[level.sprite] = level
+        # Lookup table of the IDs that can appear in level files, everything else is empty
+        self.known_ids = np.zeros(1 << 16, dtype=bool)
+        self.known_ids[[id for id in self.defaults_by_id if 0 <= id < 1 << 16]] = True
 
     def read_map(self, filename: str, source: str, data: BinaryIO | None = None) -> Grid:
         '''Parses a .l file's content, given its file path.
         Returns a Grid object containing the level data.
         '''
         grid = Grid(filename, source)
+        grid.inputs.add("data/values.lua")
         if data is None:
+            grid.inputs.add(grid.fp)
             stream = open(grid.fp, "rb")
         else:
             stream = data
@@ -457,82 +640,64 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
         # We've added the basic objects & their directions. 
         # Now we add everything else:
         if data is None:
-            fp = open(grid.fp + "d", errors="replace", encoding="utf-8")
+            grid.inputs.add(grid.fp + "d")
+            level_file = LevelFile.read(grid.fp + "d")
         else:
-            fp = data
-        
-        # Strict mode must be disabled to match
-        # the game's lenient parsing
-        config = configparser.ConfigParser(strict=False)
-        config.read_file(fp)
+            level_file = LevelFile.parse(data)
         
         # Name and palette should never be missing, but I can't guarantee this for custom levels
-        grid.name = config.get("general", "name", fallback="name missing")
-        grid.palette = config.get("general", "palette", fallback="default.png")[:-4] # strip .png
-        grid.subtitle = config.get("general", "subtitle", fallback=None)
-        grid.map_id = config.get("general", "mapid", fallback=None)
+        grid.name = level_file.get("general", "name", fallback="name missing")
+        grid.palette = level_file.get("general", "palette", fallback="default.png")[:-4] # strip .png
+        grid.subtitle = level_file.get("general", "subtitle", fallback=None)
+        grid.map_id = level_file.get("general", "mapid", fallback=None)
 
         if custom:
-            # difficulty_string = config.get("general", "difficulty", fallback=None)
-            grid.author = config.get("general", "author", fallback=None)
+            # difficulty_string = level_file.get("general", "difficulty", fallback=None)
+            grid.author = level_file.get("general", "author", fallback=None)
 
         # Only applicable to old style cursors
         # "cursor not visible" is denoted with X and Y set to -1
-        cursor_x = config.getint("general", "selectorX", fallback=-1)
-        cursor_y = config.getint("general", "selectorY", fallback=-1)
+        cursor_x = level_file.getint("general", "selectorX", fallback=-1)
+        cursor_y = level_file.getint("general", "selectorY", fallback=-1)
         if cursor_y != -1 and cursor_x != -1:
             cursor = self.defaults_by_name["cursor"]
             pos = flatten(cursor_x, cursor_y, grid.width)
             grid.cells[pos].append(cursor)
 
         # Add path objects to the grid (they're not in the normal objects)
-        path_count = config.getint("general", "paths", fallback=0)
-        for i in range(path_count):
-            pos = flatten(
-                config.getint("paths", f"{i}X"),
-                config.getint("paths", f"{i}Y"),
-                grid.width
-            )
-            obj = config.get("paths", f"{i}object")
-            path = self.defaults_by_object[obj].copy()
-            path.direction = config.getint("paths", f"{i}dir")
+        for record in level_file.paths():
+            pos = flatten(record.x, record.y, grid.width)
+            path = self.defaults_by_object[record.obj].copy()
+            path.direction = record.direction
             grid.cells[pos].append(path)
 
         child_levels = {}
 
         # Add level objects & initialize level tree
-        level_count = config.getint("general", "levels", fallback=0)
-        for i in range(level_count):
+        for record in level_file.levels():
             # Level colors can sometimes be omitted, defaults to white
-            color = config.get("levels", f"{i}colour", fallback=None)
-            if color is None:
+            if record.color is None:
                 level = Item.level()
             else:
-                c_0, c_1 = color.split(",")
-                level = Item.level((int(c_0), int(c_1)))
-            
-            x = config.getint("levels", f"{i}X") # no fallback
-            y = config.getint("levels", f"{i}Y") # if you can't locate it, it's fricked
-            pos = flatten(x, y, grid.width)
+                level = Item.level(record.color)
+            pos = flatten(record.x, record.y, grid.width)
             
             # # z mixed up with layer?
-            # z = config.getint("levels", f"{i}Z", fallback=0)
+            # z = level_file.getint("levels", f"{i}Z", fallback=0)
             # level.layer = z
 
             grid.cells[pos].append(level)
 
             # level icons: the game handles them as special graphics
             # but the bot treats them as normal objects
-            style = config.getint("levels", f"{i}style", fallback=0)
-            number = config.getint("levels", f"{i}number", fallback=0)
+            style = record.style
+            number = record.number
             # "custom" style
             if style == -1:
-                try:
-                    icon = Item.icon(config.get("icons", f"{number}file"))
-                    grid.cells[pos].append(icon)
-                except configparser.NoSectionError:
-                    # No icon exists for the level, I guess
-                    pass
+                icon_file = level_file.icon(number)
+                # No icon exists for the level, I guess
+                if icon_file is not None:
+                    grid.cells[pos].append(Item.icon(icon_file))
             # number style
             elif style == 0:
                 if 0 <= number <= 99:
@@ -555,34 +720,32 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
                     icon = Item.icon(f"icon_default_dot_{number + 1}")
                 grid.cells[pos].append(icon)
 
-            if initialize_level_tree and grid.map_id is not None:
-                level_file = config.get("levels", f"{i}file")
+            if initialize_level_tree and grid.map_id is not None and record.file is not None:
                 # Each level within
-                child_levels[level_file] = (number, style)
+                child_levels[record.file] = (number, style)
         
         # Initialize the level tree
         # If map_id is None, then the levels are actually pointing back to this level's parent
         if initialize_level_tree and grid.map_id is not None:
             # specials are only used for special levels at the moment
-            special_count = config.getint("general", "specials", fallback=0)
-            for i in range(special_count):
-                special_data = config.get("specials", f"{i}data")
+            for special_data in level_file.specials():
                 special_kind, *special_rest = special_data.split(",")
                 if special_kind == "level":
                     # note: because of the comma separation these are still strings
-                    level_file, style, number, *_ = special_rest
+                    level_file_name, style, number, *_ = special_rest
                     child = (int(number), int(style))
-                    # print("adding spec to node", parent, grid.map_id, level_file, child)
-                    child_levels[level_file] = child
+                    # print("adding spec to node", parent, grid.map_id, level_file_name, child)
+                    child_levels[level_file_name] = child
                 
             # merges both normal level & special level data together
             if child_levels:
                 self.parent_levels[grid.filename] = (grid.map_id, child_levels)
 
         # Add background images
-        image_count = config.getint("images", "total", fallback=0)
-        for i in range(image_count):
-            grid.images.append(config.get("images", str(i)))
+        for image in level_file.images():
+            grid.images.append(image)
+            # One file per animation frame, see Renderer.render
+            grid.inputs.update(f"data/images/{grid.world}/{image}_{frame}.png" for frame in (1, 2, 3))
         
         # Alternate would be to use changed_count & reading each record
         # The reason these aren't all just in `changed` is that MF2 limits
@@ -592,26 +755,8 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
         # Probably not, since you'd need over 300 changed objects and I'm
         # not sure that's allowed by the editor (maybe file editing)
         #
-        # `changed_short` exists for some custom levels
-        changed_record = config.get("tiles", "changed_short", fallback=None)
-        if changed_record is None:
-            # levels in the base game (and custom levels without `changed_short`)
-            # all provide `changed`, which CAN be an empty string
-            # `split` doesn't filter out the empty string so this 
-            changed_record = config.get("tiles", "changed")
-            changed_tiles = [x for x in changed_record.rstrip(",").split(",") if x != ""]
-        else:
-            changed_tiles = [f"object{x}" for x in changed_record.rstrip(",").split(",") if x != ""]
-        
         # include only changes that will affect the visuals
-        changes: dict[str, dict[str, Any]] = {tile: {} for tile in changed_tiles}
-        attrs = ("image", "colour", "activecolour", "layer", "tiling")
-        for tile in changed_tiles:
-            for attr in attrs:
-                # `tile` is of the form "objectXYZ", and 
-                new_attr = config.get("tiles", f"{tile}_{attr}", fallback=None)
-                if new_attr is not None:
-                    changes[tile][attr] = new_attr
+        changes = level_file.changes(("image", "colour", "activecolour", "layer", "tiling"))
         
         for cell in grid.cells:
             for item in cell:
@@ -676,22 +821,9 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
 
         zobj = zlib.decompressobj()
         map_buffer = zobj.decompress(compressed)
-
-        items = []
-        for j,k in enumerate(range(0, len(map_buffer), 2)):
-            cell = grid.cells[j]
-            id = int.from_bytes(map_buffer[k : k + 2], byteorder="little")
-
-            item = self.defaults_by_id.get(id)
-            if item is not None:
-                item = item.copy()
-            else:
-                item = Item.empty()
-                id = -1
-            items.append(item)
-            
-            if id != -1:
-                cell.append(item)
+        # One little-endian 16-bit object ID per cell
+        ids = np.frombuffer(map_buffer, dtype="<u2", count=len(map_buffer) // 2)
+        directions = np.zeros(len(ids), dtype=np.uint8)
 
         if data_blocks == 2:
             # DATA
@@ -701,14 +833,17 @@ class Reader(commands.Cog, command_attrs=dict(hidden=True)):
 
             zobj = zlib.decompressobj()
             dirs_buffer = zobj.decompress(stream.read(compressed_size))
-
-            for j in range(len(dirs_buffer) - 1):
-                try:
-                    item = items[j]
-                    item.direction = dirs_buffer[j]
-                except IndexError:
-                    # huh?
-                    break
+            # One direction byte per cell. The last byte is never used
+            count = min(len(dirs_buffer) - 1, len(ids))
+            if count > 0:
+                directions[:count] = np.frombuffer(dirs_buffer, dtype=np.uint8, count=count)
+
+        # Only the cells with objects get items
+        occupied = np.flatnonzero(self.known_ids[ids])
+        for j, id, direction in zip(occupied.tolist(), ids[occupied].tolist(), directions[occupied].tolist()):
+            item = self.defaults_by_id[id].copy()
+            item.direction = direction
+            grid.cells[j].append(item)
 
 async def setup(bot: Bot):
     await bot.add_cog(Reader(bot))
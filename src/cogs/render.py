@@ -10,13 +10,17 @@ from typing import TYPE_CHECKING, BinaryIO
 import numpy as np
 from PIL import Image, ImageChops, ImageFilter
 
-from .. import constants, errors
+from .. import cache, compositor, constants, errors
+from ..db import TileData
+from ..recolor import recolor
 from ..tile import FullTile, Grid, ReadyTile
-from ..utils import cached_open
+from ..workers import RenderResult
 from ..save_transparent_gif import save_transparent_gif
+from ..text_layout import layout_text, letter_seed
 
 if TYPE_CHECKING:
     from ...ROBOT import Bot
+    from ..workers import RenderJob
 
 
 class Renderer:
@@ -26,15 +30,6 @@ class Renderer:
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
 
-    def recolor(self, sprite: Image.Image, rgb: tuple[int, int, int]) -> Image.Image:
-        '''Apply rgb color multiplication (0-255)'''
-        r,g,b = rgb
-        arr = np.asarray(sprite, dtype='float64')
-        arr[..., 0] *= r / 256
-        arr[..., 1] *= g / 256
-        arr[..., 2] *= b / 256
-        return Image.fromarray(arr.astype('uint8'))
-
     async def render(
         self,
         grid: Grid[ReadyTile],
@@ -67,32 +62,36 @@ class Renderer:
             background_color = palette_img.getpixel(background)
         else:
             background_color = (0, 0, 0, 0)
-        imgs: list[Image.Image] = []
+        # Solid fill for masked and cut tiles
+        fill = tuple(background_color) if len(background_color) == 4 else (*background_color, 255)
         # This is appropriate padding, no sprites can go beyond it
         padding = constants.DEFAULT_SPRITE_SIZE
         width, height = grid_size
-        for _ in range(duration):
-            for frame in range(frame_count):
-                img_width = width * constants.DEFAULT_SPRITE_SIZE + 2 * padding
-                img_height =  height * constants.DEFAULT_SPRITE_SIZE + 2 * padding
-
-                if images and image_source is not None:
-                    img = Image.new("RGBA", (img_width, img_height))
-                    # for loop in case multiple background images are used (i.e. baba's world map)
-                    for image in images:
-                        try:
-                            overlap = Image.open(f"data/images/{image_source}/{image}_{frame + 1}.png").convert("RGBA") # bg images are 1-indexed
-                        except FileNotFoundError:
-                            # no animations, default to frame 1
-                            overlap = Image.open(f"data/images/{image_source}/{image}_1.png").convert("RGBA") # bg images are 1-indexed
-                        img.paste(overlap, (padding, padding), mask=overlap)
-                # bg color
-                elif background is not None:
-                    img = Image.new("RGBA", (img_width, img_height), color=background_color)
-                # neither
-                else: 
-                    img = Image.new("RGBA", (img_width, img_height))
-                imgs.append(img)
+        img_width = width * constants.DEFAULT_SPRITE_SIZE + 2 * padding
+        img_height =  height * constants.DEFAULT_SPRITE_SIZE + 2 * padding
+        backgrounds = []
+        for frame in range(frame_count):
+            if images and image_source is not None:
+                img = Image.new("RGBA", (img_width, img_height))
+                # for loop in case multiple background images are used (i.e. baba's world map)
+                for image in images:
+                    try:
+                        overlap = Image.open(f"data/images/{image_source}/{image}_{frame + 1}.png").convert("RGBA") # bg images are 1-indexed
+                    except FileNotFoundError:
+                        # no animations, default to frame 1
+                        overlap = Image.open(f"data/images/{image_source}/{image}_1.png").convert("RGBA") # bg images are 1-indexed
+                    img.paste(overlap, (padding, padding), mask=overlap)
+            # bg color
+            elif background is not None:
+                img = Image.new("RGBA", (img_width, img_height), color=background_color)
+            # neither
+            else: 
+                img = Image.new("RGBA", (img_width, img_height))
+            backgrounds.append(np.asarray(img))
+        frames = np.stack([backgrounds[frame] for _ in range(duration) for frame in range(frame_count)])
+        pastes = compositor.Compositor(frames, constants.DEFAULT_SPRITE_SIZE)
+        # Sprites are shared between tiles, only convert each of them once
+        arrays: dict[int, np.ndarray] = {}
         
         # keeping track of the amount of padding we can slice off
         pad_r=pad_u=pad_l=pad_d=0
@@ -101,8 +100,12 @@ class Renderer:
                 if tile.frames is None:
                     continue
                 for frame, sprite in enumerate(tile.frames[:frame_count]):
-                    x_offset = (sprite.width - constants.DEFAULT_SPRITE_SIZE) // 2
-                    y_offset = (sprite.height - constants.DEFAULT_SPRITE_SIZE) // 2
+                    arr = arrays.get(id(sprite))
+                    if arr is None:
+                        arr = arrays[id(sprite)] = np.asarray(sprite)
+                    sprite_height, sprite_width = arr.shape[:2]
+                    x_offset = (sprite_width - constants.DEFAULT_SPRITE_SIZE) // 2
+                    y_offset = (sprite_height - constants.DEFAULT_SPRITE_SIZE) // 2
                     if x == 0:
                         pad_l = max(pad_l, x_offset)
                     if x == width - 1:
@@ -111,30 +114,25 @@ class Renderer:
                         pad_u = max(pad_u, y_offset)
                     if y == height - 1:
                         pad_d = max(pad_d, y_offset)
-                        alpha = sprite.getchannel("A")
-                    
-                    alpha = sprite.getchannel("A")
-                    if tile.mask_alpha:
-                        sprite = Image.new("RGBA", sprite.size, background_color)
-                        alpha = ImageChops.invert(alpha)
-                    elif tile.cut_alpha:
-                        sprite = Image.new("RGBA", sprite.size, background_color)
-
-                    imgs[t * frame_count + frame].paste(
-                        sprite, 
+
+                    pastes.paste(
+                        t * frame_count + frame,
                         (
                             x * constants.DEFAULT_SPRITE_SIZE + padding - x_offset,
                             y * constants.DEFAULT_SPRITE_SIZE + padding - y_offset
-                        ), 
-                        mask=alpha
+                        ),
+                        arr,
+                        color=fill if tile.mask_alpha or tile.cut_alpha else None,
+                        invert=tile.mask_alpha,
                     )
 
-        outs = []
-        for img in imgs:
-            img = img.crop((padding - pad_l, padding - pad_u, img.width - padding + pad_r, img.height - padding + pad_d))
-            if upscale:
-                img = img.resize((2 * img.width, 2 * img.height), resample=Image.Resampling.NEAREST)
-            outs.append(img)
+        frames = compositor.crop(
+            pastes.composite(),
+            (padding - pad_l, padding - pad_u, img_width - padding + pad_r, img_height - padding + pad_d)
+        )
+        if upscale:
+            frames = compositor.upscale(frames, 2)
+        outs = [Image.fromarray(frame) for frame in frames]
 
         self.save_frames(
             outs,
@@ -150,17 +148,41 @@ class Renderer:
         position: tuple[int, int, int],
         palette_img: Image.Image,
         random_animations: bool = False,
-        sprite_cache: dict[str, Image.Image]
+        seed: int | None = None
     ) -> ReadyTile:
-        '''woohoo'''
+        '''woohoo
+
+        Custom text picks its letters at random, or from `seed` and its position if it's given.
+        '''
         if tile.empty:
             return ReadyTile(None)
-        out = []
         x, y, _ = position
-        for frame in range(3):
-            wobble = (11 * x + 13 * y + frame) % 3 if random_animations else frame
+        wobbles = [(11 * x + 13 * y + frame) % 3 if random_animations else frame for frame in range(3)]
+        rgb = tile.color_rgb if tile.color_rgb is not None else palette_img.getpixel(tile.color_index)
+        # Unseeded custom text is randomized, so it can't be reused
+        key = None
+        if not tile.custom or seed is not None:
+            key = (
+                tile.name,
+                tile.sprite,
+                tile.variant_number,
+                tile.variant_fallback,
+                tile.custom_style,
+                tile.custom_direction,
+                tile.meta_level,
+                tile.face,
+                tile.blank,
+                rgb,
+                tuple(wobbles),
+                (x, y, seed) if tile.custom else None,
+            )
+            frames = cache.ready_tiles.get(key)
+            if frames is not None:
+                return ReadyTile(frames, tile.mask_alpha, tile.cut_alpha)
+        out = []
+        for wobble in wobbles:
             if tile.custom:
-                sprite = await self.generate_sprite(
+                sprite = self.generate_sprite(
                     tile.name,
                     style=tile.custom_style or "noun",
                     direction=tile.custom_direction,
@@ -168,29 +190,26 @@ class Renderer:
                     face=tile.face,
                     blank=tile.blank,
                     wobble=wobble,
+                    seed=None if seed is None else letter_seed(tile.name, (x, y), wobble, seed),
                 )
             else:
-                path_fallback = None
                 if tile.name in ("icon",):
-                    path = f"data/sprites/{constants.BABA_WORLD}/{tile.name}.png"
+                    sprite = cache.open_sprite(constants.BABA_WORLD, tile.name, None, None)
                 elif tile.name in ("smiley", "hi") or tile.name.startswith("icon"):
-                    path = f"data/sprites/{constants.BABA_WORLD}/{tile.name}_1.png"
+                    sprite = cache.open_sprite(constants.BABA_WORLD, tile.name, None, 1)
                 elif tile.name == "default":
-                    path = f"data/sprites/{constants.BABA_WORLD}/default_{wobble + 1}.png"
+                    sprite = cache.open_sprite(constants.BABA_WORLD, "default", None, wobble + 1)
                 else:
                     source, sprite_name = tile.sprite
-                    path = f"data/sprites/{source}/{sprite_name}_{tile.variant_number}_{wobble + 1}.png"
-                    path_fallback = f"data/sprites/{source}/{sprite_name}_{tile.variant_fallback}_{wobble + 1}.png"
-                try:
-                    sprite = cached_open(path, cache=sprite_cache, fn=Image.open).convert("RGBA")
-                except FileNotFoundError:
-                    if path_fallback is not None:
-                        sprite = cached_open(path_fallback, cache=sprite_cache, fn=Image.open).convert("RGBA")
-                    else:
-                        raise
+                    try:
+                        sprite = cache.open_sprite(source, sprite_name, tile.variant_number, wobble + 1)
+                    except FileNotFoundError:
+                        sprite = cache.open_sprite(source, sprite_name, tile.variant_fallback, wobble + 1)
                 
-                sprite = await self.apply_options_name(
+                assert tile.tile_data is not None
+                sprite = self.apply_options_name(
                     tile.name,
+                    tile.tile_data,
                     sprite,
                     style=tile.custom_style,
                     direction=tile.custom_direction,
@@ -200,10 +219,11 @@ class Renderer:
                     wobble=wobble,
                 )
             # Color conversion
-            rgb = tile.color_rgb if tile.color_rgb is not None else palette_img.getpixel(tile.color_index)
-            sprite = self.recolor(sprite, rgb)
+            sprite = recolor(sprite, rgb)
             out.append(sprite)
         f0, f1, f2 = out
+        if key is not None:
+            cache.ready_tiles.put(key, (f0, f1, f2))
         return ReadyTile((f0, f1, f2), tile.mask_alpha, tile.cut_alpha)
 
     async def render_full_tiles(
@@ -211,10 +231,10 @@ class Renderer:
         grid: Grid[FullTile],
         *,
         palette: str = "default",
-        random_animations: bool = False
+        random_animations: bool = False,
+        seed: int | None = None
     ) -> Grid[ReadyTile]:
         '''Final individual tile processing step'''
-        sprite_cache = {}
         palette_img = Image.open(f"data/palettes/{palette}.png").convert("RGB")
 
         out = {}
@@ -225,13 +245,41 @@ class Renderer:
                     position=index,
                     palette_img=palette_img,
                     random_animations=random_animations,
-                    sprite_cache=sprite_cache
+                    seed=seed
                 )
                 for tile in stack
             ]
         return out
 
-    async def generate_sprite(
+    async def render_job(self, job: RenderJob) -> RenderResult:
+        '''Renders a scene from start to finish, returning the GIF (and zip file, if requested) as bytes.'''
+        buffer = BytesIO()
+        extra_buffer = BytesIO() if job.extra_name is not None else None
+        full_tiles = await self.render_full_tiles(
+            job.grid,
+            palette=job.palette,
+            random_animations=job.random_animations,
+            seed=job.seed
+        )
+        await self.render(
+            full_tiles,
+            grid_size=job.grid_size,
+            duration=job.duration,
+            palette=job.palette,
+            background=job.background,
+            out=buffer,
+            delay=job.delay,
+            frame_count=job.frame_count,
+            upscale=job.upscale,
+            extra_out=extra_buffer,
+            extra_name=job.extra_name,
+        )
+        return RenderResult(
+            buffer.getvalue(),
+            None if extra_buffer is None else extra_buffer.getvalue()
+        )
+
+    def generate_sprite(
         self,
         text: str,
         *,
@@ -250,16 +298,17 @@ class Renderer:
 
         # This is to prevent possible DOS attacks using massive text
         # Note however that this is unlikely to be an issue unless this
-        # function takes input from unexpected sources, as even 8 ** 4000
+        # function takes input from unexpected sources, as even 256 ** 4000
         # is relatively okay to compute
         # The default is low enough to prevent abuse, but high enough to 
         # ensure that no actual text can be excluded.
         if len(raw) > constants.MAX_TEXT_LENGTH:
             raise errors.CustomTextTooLong(text)
 
+        # One byte of the seed for each letter
         if seed is None:
-            seed = random.randint(0, 8 ** len(raw))
-        seed_digits = [(seed >> 8 * i ) | 0b11111111 for i in range(len(raw))]
+            seed = random.getrandbits(8 * len(raw))
+        seed_digits = [(seed >> 8 * i) & 0xFF for i in range(len(raw))]
         
         # Get mode and split status
         if newline_count > 1:
@@ -299,132 +348,20 @@ class Renderer:
                 wobble=wobble
             )
 
-        width_cache: dict[str, list[int]] = {}
-        for c in raw:
-            rows = await self.bot.db.conn.fetchall(
-                '''
-                SELECT char, width FROM letters
-                WHERE char == ? AND mode == ?;
-                ''',
-                c, mode
-            )
-
-            for row in rows:
-                char, width = row
-                width_cache.setdefault(char, []).append(width)
-
-        def width_greater_than(c: str, w: int = 0) -> int:
-            try:
-                return min(width for width in width_cache[c] if width > w)
-            except ValueError:
-                raise KeyError
-
-        # fetch the minimum possible widths first
-        try:
-            widths: list[int] = [width_greater_than(c) for c in raw]
-        except KeyError as e:
-            raise errors.BadCharacter(text, mode, e.args[0])
-
-        max_width = constants.DEFAULT_SPRITE_SIZE
-        def check_or_adjust(widths: list[int], index: int) -> int:
-            '''Is the arrangement valid?'''
-            if mode == "small":
-                if fixed:
-                    if sum(widths[:index]) > max_width or sum(widths[index:]) > max_width:
-                        raise errors.CustomTextTooLong(text)
-                else:
-                    if sum(widths) > 2 * max_width:
-                        raise errors.CustomTextTooLong(text)
-                    while sum(widths[:index]) > max_width:
-                        index -= 1
-                    while sum(widths[index:]) > max_width:
-                        index += 1
-                    if sum(widths[:index]) > max_width or sum(widths[index:]) > max_width:
-                        raise errors.CustomTextTooLong(text)
-                    if index == 0 or index == len(raw):
-                        raise errors.CustomTextTooLong(text)
-                    return index
-            else:
-                if sum(widths) > max_width:
-                    raise errors.CustomTextTooLong(text)
-            return index
-        
-        def too_squished(widths: list[int], index: int) -> bool:
-            '''Is the arrangement too squished? (bad letter spacing)'''
-            if mode == "small":
-                top = widths[:index]
-                top_gaps = max_width - sum(top)
-                bottom = widths[index:]
-                bottom_gaps = max_width - sum(bottom)
-                return top_gaps < len(top) - 1 or bottom_gaps < len(bottom) - 1
-            else:
-                gaps = max_width - sum(widths)
-                return gaps < len(widths) - 1
-        
-        # Check if the arrangement is valid with minimum sizes
-        # If allowed, shift the index to make the arrangement valid
-        index = check_or_adjust(widths, index)
-
-        # Wxpand widths where possible
-        stable = [False for _ in range(len(widths))]
-        while not all(stable):
-            old_width, i = min((w, i) for i, w in enumerate(widths) if not stable[i])
-            try:
-                new_width = width_greater_than(raw[i], old_width)
-            except KeyError:
-                stable[i] = True
-                continue
-            widths[i] = new_width
-            try:
-                index = check_or_adjust(widths, index)
-            except errors.CustomTextTooLong:
-                widths[i] = old_width
-                stable[i] = True
-            else:
-                if too_squished(widths, index):
-                    # We've shown that a "perfect" width already exists below this
-                    # So stick to the "perfect" one
-                    widths[i] = old_width
-                    stable[i] = True
-
-        # Arrangement is now the widest it can be
-        # Kerning: try for 1 pixel between sprites, and rest to the edges
-        gaps: list[int] = []
-        if mode == "small":
-            rows = [widths[:index], widths[index:]]
-        else:
-            rows = [widths[:]]
-        for row in rows:
-            space = max_width - sum(row)
-            # Extra -1 is here to not give kerning space outside the left/rightmost char
-            chars = len(row) - 1
-            if space >= chars:
-                # left edge
-                gaps.append((space - chars) // 2)
-                # char gap
-                gaps.extend([1] * chars)
-                # right edge gap is implied
-            else:
-                # left edge
-                gaps.append(0)
-                # as many char gaps as possible, starting from the left
-                gaps.extend([1] * space)
-                gaps.extend([0] * (chars - space))
+        atlas = self.bot.db.letters
+        # Every frame, and every later sprite of the same text, shares one layout
+        available = tuple(atlas.widths(mode, c) for c in raw)
+        key = text, mode, available
+        layout = cache.text_layouts.get(key)
+        if layout is None:
+            layout = layout_text(text, mode, available)
+            cache.text_layouts.put(key, layout)
+        widths, index, gaps = layout.widths, layout.index, layout.gaps
 
         letters: list[Image.Image] = []
         for c, seed_digit, width in zip(raw, seed_digits, widths):
-            l_rows = await self.bot.db.conn.fetchall(
-                # fstring use safe
-                f'''
-                SELECT char, width, sprite_{int(wobble)} FROM letters
-                WHERE char == ? AND mode == ? AND width == ?
-                ''',
-                c, mode, width
-            )
-            options = list(l_rows)
-            char, width, letter_sprite = options[seed_digit % len(options)]
-            buf = BytesIO(letter_sprite)
-            letters.append(Image.open(buf))
+            options = atlas.options(mode, c, width)
+            letters.append(options[seed_digit % len(options)][wobble])
 
         sprite = Image.new("L", (constants.DEFAULT_SPRITE_SIZE, constants.DEFAULT_SPRITE_SIZE))
         if mode == "small":
@@ -470,9 +407,10 @@ class Renderer:
             wobble=wobble
         )
 
-    async def apply_options_name(
+    def apply_options_name(
         self,
         name: str,
+        tile_data: TileData,
         sprite: Image.Image,
         *,
         style: str | None,
@@ -482,9 +420,7 @@ class Renderer:
         blank: bool,
         wobble: int
     ) -> Image.Image:
-        '''Takes an image, taking tile data from its name, and applies the given options to it.'''
-        tile_data = await self.bot.db.tile(name)
-        assert tile_data is not None
+        '''Takes an image, taking tile data from the tile it belongs to, and applies the given options to it.'''
         original_style = constants.TEXT_TYPES[tile_data.text_type]
         original_direction = tile_data.text_direction
         if style is None:
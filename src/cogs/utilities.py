@@ -398,7 +398,7 @@ class UtilityCommandsCog(commands.Cog, name="Utility Commands"):
         )
 
         tile_data_cache: dict[str, TileData] = {}
-        data = await self.bot.db.tile(clean_tile)
+        data = self.bot.db.tile(clean_tile)
         if data is not None:
             tile_data_cache[clean_tile] = data
         else:
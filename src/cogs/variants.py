@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING, Any, Callable
 from src.db import TileData
 
 from .. import constants, errors
+from ..cache import LRUCache
 from ..tile import FullTile, Grid, RawTile, TileFields
 
 if TYPE_CHECKING:
@@ -61,6 +62,11 @@ class VariantHandlers:
         self.bot = bot
         self.default_fields: DefaultFn = lambda ctx: {}
         self.tile_data_cache: dict[str, TileData] = {}
+        # Handlers by the literal variants they take, and the positions of the other handlers
+        self.literal_index: dict[str, list[int]] = {}
+        self.pattern_positions: list[int] = []
+        # variant -> handlers that take it, in the order they're applied
+        self.resolved: LRUCache[str, list[tuple[Handler, tuple[str, ...]]]] = LRUCache(constants.VARIANT_CACHE_SIZE)
 
     def handler(
         self, 
@@ -94,9 +100,39 @@ class VariantHandlers:
                 self.handlers.append(handler)
             else:
                 self.handlers.insert(order, handler)
+            self.index_handlers()
             return handler
         return deco
     
+    def index_handlers(self) -> None:
+        '''Rebuilds the lookup structures used to match variants to handlers.'''
+        self.literal_index = {}
+        self.pattern_positions = []
+        for i, handler in enumerate(self.handlers):
+            if handler.literals is not None:
+                for literal in handler.literals:
+                    self.literal_index.setdefault(literal, []).append(i)
+            else:
+                self.pattern_positions.append(i)
+        self.resolved.clear()
+
+    def resolve(self, variant: str) -> list[tuple[Handler, tuple[str, ...]]]:
+        '''The handlers that take a variant, with their matched groups.
+
+        Handlers are returned in the order they're applied: the latest registered first.
+        '''
+        resolved = self.resolved.get(variant)
+        if resolved is None:
+            matches = [(i, ()) for i in self.literal_index.get(variant, ())]
+            for i in self.pattern_positions:
+                groups = self.handlers[i].match(variant)
+                if groups is not None:
+                    matches.append((i, groups))
+            matches.sort(key=lambda match: match[0], reverse=True)
+            resolved = [(self.handlers[i], groups) for i, groups in matches]
+            self.resolved.put(variant, resolved)
+        return resolved
+
     def default(self, fn: DefaultFn):
         '''Registers a default field factory.
         
@@ -180,39 +216,34 @@ class VariantHandlers:
         fields: TileFields = self.default_fields(default_ctx)
         extras = {}
         for variant in tile.variants:
-            failed = True
-            for handler in reversed(self.handlers):
-                groups = handler.match(variant)
-                if groups is not None:
-                    failed = False
-                    ctx = HandlerContext(
-                        bot=self.bot,
-                        fields=fields,
-                        groups=groups,
-                        variant=variant,
-                        tile=tile,
-                        grid=grid,
-                        position=position,
-                        extras=extras,
-                        grid_size=grid_size,
-                        tile_data_cache=tile_data_cache,
-                        flags=flags
-                    )
-                    fields.update(handler.handle(ctx))
-            if failed:
+            resolved = self.resolve(variant)
+            if not resolved:
                 raise errors.UnknownVariant(tile, variant)
+            for handler, groups in resolved:
+                ctx = HandlerContext(
+                    bot=self.bot,
+                    fields=fields,
+                    groups=groups,
+                    variant=variant,
+                    tile=tile,
+                    grid=grid,
+                    position=position,
+                    extras=extras,
+                    grid_size=grid_size,
+                    tile_data_cache=tile_data_cache,
+                    flags=flags
+                )
+                fields.update(handler.handle(ctx))
         full = FullTile.from_tile_fields(tile, fields)
         self.finalizer(full, **flags)
         return full
 
-    async def handle_grid(self, grid: Grid[RawTile], grid_size: tuple[int, int], **flags: Any) -> Grid[FullTile]:
+    def handle_grid(self, grid: Grid[RawTile], grid_size: tuple[int, int], **flags: Any) -> Grid[FullTile]:
         '''Apply variants to a full grid of raw tiles'''
-        tile_data_cache = {
-            data.name: data async for data in self.bot.db.tiles(
-                set(tile.name for stack in grid.values() for tile in stack),
-                maximum_version = flags.get("ignore_editor_overrides", 1000)
-            )
-        }
+        tile_data_cache = self.bot.db.tiles(
+            (tile.name for stack in grid.values() for tile in stack),
+            maximum_version = flags.get("ignore_editor_overrides", 1000)
+        )
         return {
             index: [self.handle_tile(tile, grid, index, grid_size, tile_data_cache, **flags) for tile in stack]
             for index, stack in grid.items()
@@ -228,6 +259,12 @@ class Handler:
         group: str | None
     ):
         self.pattern = pattern
+        self.regex = re.compile(pattern)
+        # Patterns that are just alternatives of plain words are matched with a set lookup
+        alternatives = pattern.split("|")
+        self.literals: frozenset[str] | None = None
+        if all(alternative and re.escape(alternative) == alternative for alternative in alternatives):
+            self.literals = frozenset(alternatives)
         self.fn = fn
         self.hints = hints
         self.group = group
@@ -241,7 +278,9 @@ class Handler:
         
         Returns the matched groups if possible, else returns `None`.
         '''
-        matches = re.fullmatch(self.pattern, variant)
+        if self.literals is not None:
+            return () if variant in self.literals else None
+        matches = self.regex.fullmatch(variant)
         if matches is not None:
             return matches.groups()
     
@@ -310,6 +349,7 @@ async def setup(bot: Bot):
                 "color_index": color,
                 "meta_level": 0,
                 "sprite": (tile_data.source, tile_data.sprite),
+                "tile_data": tile_data,
             }
         if not ctx.tile.is_text:
             raise errors.TileNotFound(ctx.tile)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import Hashable
+
+import numpy as np
+
+def _pixels(arr: np.ndarray) -> np.ndarray:
+    '''Views RGBA data as one 32-bit integer per pixel'''
+    return np.ascontiguousarray(arr).view(np.uint32)[..., 0]
+
+def blend(dst: np.ndarray, src: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    '''Blends RGBA `src` onto RGBA `dst` through an 8-bit `mask`.
+
+    This is the same integer arithmetic as `Image.paste` with an "L" mask,
+    so all four channels (alpha included) are blended.
+    '''
+    # Sprites are mostly fully opaque or fully transparent, which need no arithmetic
+    out = np.where(mask == 255, _pixels(src), _pixels(dst)).view(np.uint8).reshape(dst.shape)
+    partial = (mask != 0) & (mask != 255)
+    if partial.any():
+        m = mask[partial].astype(np.uint16)[..., None]
+        src = np.broadcast_to(src, dst.shape)[partial]
+        # The intermediate values never exceed 16 bits
+        tmp = dst[partial].astype(np.uint16) * (255 - m) + src.astype(np.uint16) * m + 128
+        out[partial] = ((tmp >> 8) + tmp) >> 8
+    return out
+
+def crop(frames: np.ndarray, box: tuple[int, int, int, int]) -> np.ndarray:
+    '''Crops a stack of frames to a (left, upper, right, lower) box.
+
+    Like `Image.crop`, areas of the box outside of the frames are transparent.
+    '''
+    left, upper, right, lower = box
+    height, width = frames.shape[1:3]
+    if left >= 0 and upper >= 0 and right <= width and lower <= height:
+        return frames[:, upper:lower, left:right]
+    out = np.zeros((frames.shape[0], lower - upper, right - left) + frames.shape[3:], dtype=frames.dtype)
+    x0, y0 = max(left, 0), max(upper, 0)
+    x1, y1 = min(right, width), min(lower, height)
+    if x0 < x1 and y0 < y1:
+        out[:, y0 - upper:y1 - upper, x0 - left:x1 - left] = frames[:, y0:y1, x0:x1]
+    return out
+
+def upscale(frames: np.ndarray, factor: int) -> np.ndarray:
+    '''Scales a stack of RGBA frames up by an integer factor, like `Image.Resampling.NEAREST`'''
+    count, height, width = frames.shape[:3]
+    pixels = _pixels(frames).repeat(factor, axis=2).repeat(factor, axis=1)
+    return pixels.view(np.uint8).reshape(count, height * factor, width * factor, 4)
+
+class Compositor:
+    '''Pastes many sprites onto a stack of RGBA frames, in bulk.
+
+    Pastes are queued with `paste`, and applied by `composite`. The result is
+    the same as pasting each sprite in order with `Image.paste`: pastes that
+    can't overlap are grouped into layers, and each layer is applied in as
+    few operations as possible, one per sprite size.
+    '''
+    def __init__(self, frames: np.ndarray, cell_size: int) -> None:
+        self.frames = np.ascontiguousarray(frames)
+        self.cell_size = cell_size
+        # (frame, cell x, cell y) -> number of layers queued on that cell
+        self.heights: dict[tuple[int, int, int], int] = {}
+        self.layers: list[dict[Hashable, list[tuple[int, int, int, np.ndarray]]]] = []
+
+    def paste(
+        self,
+        frame: int,
+        position: tuple[int, int],
+        sprite: np.ndarray,
+        *,
+        color: tuple[int, int, int, int] | None = None,
+        invert: bool = False
+    ) -> None:
+        '''Queues an RGBA sprite to be pasted on a frame, masked by its alpha channel.
+
+        If `color` is given, the area under the mask is filled with that color instead.
+        If `invert` is set, the mask is inverted.
+        '''
+        height, width = sprite.shape[:2]
+        if height == 0 or width == 0:
+            return
+        x, y = position
+        size = self.cell_size
+        left, upper = x // size, y // size
+        right, lower = (x + width - 1) // size, (y + height - 1) // size
+        if left == right and upper == lower:
+            cell = frame, left, upper
+            layer = self.heights.get(cell, 0)
+            self.heights[cell] = layer + 1
+        else:
+            cells = [(frame, cx, cy) for cy in range(upper, lower + 1) for cx in range(left, right + 1)]
+            layer = max(self.heights.get(cell, 0) for cell in cells)
+            for cell in cells:
+                self.heights[cell] = layer + 1
+        if layer == len(self.layers):
+            self.layers.append({})
+        self.layers[layer].setdefault((height, width, color, invert), []).append((frame, x, y, sprite))
+
+    def composite(self) -> np.ndarray:
+        '''Applies the queued pastes, and returns the frames.'''
+        for layer in self.layers:
+            for (height, width, color, invert), pastes in layer.items():
+                self._paste_group(height, width, color, invert, pastes)
+        self.layers.clear()
+        self.heights.clear()
+        return self.frames
+
+    def _paste_group(
+        self,
+        height: int,
+        width: int,
+        color: tuple[int, int, int, int] | None,
+        invert: bool,
+        pastes: list[tuple[int, int, int, np.ndarray]]
+    ) -> None:
+        frames = self.frames
+        frame_height, frame_width = frames.shape[1:3]
+        fill = None if color is None else np.array(color, dtype=np.uint8)
+        inside = []
+        for paste in pastes:
+            _, x, y, sprite = paste
+            if x >= 0 and y >= 0 and x + width <= frame_width and y + height <= frame_height:
+                inside.append(paste)
+                continue
+            # Partially (or entirely) out of bounds, clip it
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + width, frame_width), min(y + height, frame_height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            sprite = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+            mask = 255 - sprite[..., 3] if invert else sprite[..., 3]
+            dst = frames[paste[0], y0:y1, x0:x1]
+            dst[:] = blend(dst, sprite if fill is None else fill, mask)
+        if not inside:
+            return
+        # Every possible (height, width) window of the frames, so that any set of
+        # pastes can be gathered and scattered in one operation
+        strides = frames.strides
+        windows = np.lib.stride_tricks.as_strided(
+            frames,
+            shape=(frames.shape[0], frame_height - height + 1, frame_width - width + 1, height, width, 4),
+            strides=strides[:3] + strides[1:],
+        )
+        region = (
+            np.array([paste[0] for paste in inside]),
+            np.array([paste[2] for paste in inside]),
+            np.array([paste[1] for paste in inside])
+        )
+        sprites = np.stack([paste[3] for paste in inside])
+        mask = 255 - sprites[..., 3] if invert else sprites[..., 3]
+        windows[region] = blend(windows[region], sprites if fill is None else fill, mask)
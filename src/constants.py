@@ -9,6 +9,16 @@ MAX_TEXT_LENGTH = 48
 MAX_VOLUME = 4096
 MAX_INPUT_FILE_SIZE = 65535
 
+# caches
+SPRITE_CACHE_SIZE = 64 * 1024 * 1024 # bytes
+MISSING_SPRITE_CACHE_SIZE = 4096 # sprites
+READY_TILE_CACHE_SIZE = 64 * 1024 * 1024 # bytes
+VARIANT_CACHE_SIZE = 4096 # variants
+TEXT_LAYOUT_CACHE_SIZE = 4096 # texts
+RENDER_CACHE_SIZE = 32 * 1024 * 1024 # bytes
+RENDER_CACHE_TTL = 60 # seconds
+RENDER_DISK_CACHE_SIZE = 256 * 1024 * 1024 # bytes
+
 # variants
 DIRECTION_TILINGS = {
     0, 2, 3
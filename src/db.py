@@ -4,29 +4,75 @@ import json
 import random
 import string
 from dataclasses import dataclass
+from io import BytesIO
 from sqlite3.dbapi2 import Row
-from typing import AsyncGenerator, Iterable
+from typing import Iterable, Optional
 
 import asqlite
 from PIL import Image
 
 from .constants import BABA_WORLD, DIRECTIONS
 
+# Changes to the schema since `create_tables`, applied in order. The database's
+# `user_version` is the number of migrations it has been through.
+# Every migration must be safe to run again, since instances connect at the same time.
+MIGRATIONS = [
+    # Indexes for level searches, and for counting the guilds of each instance
+    '''
+    CREATE INDEX IF NOT EXISTS levels_name ON levels(name);
+    CREATE INDEX IF NOT EXISTS levels_parent ON levels(LOWER(parent));
+    CREATE INDEX IF NOT EXISTS levels_map_id ON levels(LOWER(map_id));
+    CREATE INDEX IF NOT EXISTS guilds_bot_id ON guilds(bot_id);
+    ''',
+]
+
 
 class Database:
     '''Everything relating to persistent readable & writable data'''
     conn: asqlite.Connection
+    tile_index: TileIndex
+    letters: LetterAtlas
     level_hints: dict[str, dict[str, str | dict[str, str]]]
     async def connect(self, db: str) -> None:
         '''Startup'''
         with open(f"data/hints/{BABA_WORLD}.json") as fp:
             self.level_hints = json.load(fp)
         self.conn = await asqlite.connect(db) # type: ignore
+        await self.configure()
         await self.create_tables()
+        await self.migrate()
+        await self.load_tile_index()
+        await self.load_letters()
 
     async def close(self) -> None:
         '''Teardown'''
+        # Updates the query planner's statistics, if they're out of date
+        await self.conn.execute("PRAGMA optimize;")
         await self.conn.close()
+
+    async def configure(self) -> None:
+        '''Tunes the connection.
+
+        The database is in WAL mode (set by asqlite), so readers never block the writer,
+        and commits only need to be synced to disk at checkpoints.
+        '''
+        await self.conn.executescript(
+            '''
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA cache_size = -16384;
+            PRAGMA mmap_size = 268435456;
+            PRAGMA temp_store = MEMORY;
+            '''
+        )
+
+    async def migrate(self) -> None:
+        '''Applies the migrations the database hasn't been through yet, each in its own transaction.'''
+        row = await self.conn.fetchone("PRAGMA user_version;")
+        for version in range(row[0], len(MIGRATIONS)):
+            await self.conn.executescript(
+                f"BEGIN; {MIGRATIONS[version]} PRAGMA user_version = {version + 1}; COMMIT;"
+            )
     
     async def create_tables(self) -> None:
         '''Creates tables in the database according to 
@@ -134,35 +180,23 @@ class Database:
                 '''
             )
 
-    async def tile(self, name: str, *, maximum_version: int = 1000) -> TileData | None:
-        '''Convenience method to fetch a single thing of tile data. Returns None on failure.'''
-        row = await self.conn.fetchone(
-            '''
-            SELECT * FROM tiles 
-            WHERE name == ? AND version <= ?
-            ORDER BY version DESC;
-            ''',
-            name, maximum_version
-        )
-        if row is None:
-            return None
-        return TileData.from_row(row)
+    async def load_tile_index(self) -> None:
+        '''Reads all tile data into memory, replacing the previous index.'''
+        rows = await self.conn.fetchall("SELECT * FROM tiles;")
+        self.tile_index = TileIndex(rows)
 
-    async def tiles(self, names: Iterable[str], *, maximum_version: int = 1000) -> AsyncGenerator[TileData, None]:
-        '''Convenience method to fetch a single thing of tile data. Returns None on failure.'''
-        async with self.conn.cursor() as cur:
-            for name in names:
-                await cur.execute(
-                    '''
-                    SELECT * FROM tiles 
-                    WHERE name == ? AND version < ?
-                    ORDER BY version DESC;
-                    ''',
-                    name, maximum_version
-                )
-                row = await cur.fetchone()
-                if row is not None:
-                    yield TileData.from_row(row)
+    async def load_letters(self) -> None:
+        '''Reads all letter sprites into memory, replacing the previous atlas.'''
+        rows = await self.conn.fetchall("SELECT mode, char, width, sprite_0, sprite_1, sprite_2 FROM letters ORDER BY rowid;")
+        self.letters = LetterAtlas(rows)
+
+    def tile(self, name: str, *, maximum_version: int = 1000) -> TileData | None:
+        '''Convenience method to fetch a single thing of tile data from the index. Returns None on failure.'''
+        return self.tile_index.tile(name, maximum_version=maximum_version)
+
+    def tiles(self, names: Iterable[str], *, maximum_version: int = 1000) -> dict[str, TileData]:
+        '''Fetches the tile data of many tiles at once from the index. Tiles that aren't found are left out.'''
+        return self.tile_index.tiles(names, maximum_version=maximum_version)
     
     def plate(self, direction: int | None, wobble: int) -> tuple[Image.Image, tuple[int, int]]:
         '''Plate sprites. Raises FileNotFoundError on failure.'''
@@ -221,6 +255,56 @@ class TileData:
             row["tags"].split("\t")
         )
 
+class TileIndex:
+    '''An immutable, in-memory snapshot of the tile data'''
+    def __init__(self, rows: Iterable[Row]) -> None:
+        versions: dict[str, list[tuple[int, TileData]]] = {}
+        for row in rows:
+            versions.setdefault(row["name"], []).append((row["version"], TileData.from_row(row)))
+        for tile_versions in versions.values():
+            tile_versions.sort(key=lambda pair: pair[0], reverse=True)
+        self.versions = versions
+
+    def tile(self, name: str, *, maximum_version: int = 1000) -> TileData | None:
+        '''The latest version of a tile, up to and including `maximum_version`. Returns None on failure.'''
+        for version, data in self.versions.get(name, ()):
+            if version <= maximum_version:
+                return data
+        return None
+
+    def tiles(self, names: Iterable[str], *, maximum_version: int = 1000) -> dict[str, TileData]:
+        '''The latest versions of many tiles, below `maximum_version`. Tiles that aren't found are left out.'''
+        out: dict[str, TileData] = {}
+        for name in names:
+            for version, data in self.versions.get(name, ()):
+                if version < maximum_version:
+                    out[name] = data
+                    break
+        return out
+
+LetterFrames = tuple[Optional[Image.Image], Optional[Image.Image], Optional[Image.Image]]
+
+class LetterAtlas:
+    '''An immutable, in-memory snapshot of the letters used for custom text, with their sprites decoded'''
+    def __init__(self, rows: Iterable[Row]) -> None:
+        glyphs: dict[tuple[str, str], dict[int, list[LetterFrames]]] = {}
+        for mode, char, width, *blobs in rows:
+            frames = tuple(None if blob is None else Image.open(BytesIO(blob)) for blob in blobs)
+            for frame in frames:
+                if frame is not None:
+                    frame.load()
+            glyphs.setdefault((mode, char), {}).setdefault(width, []).append(frames) # type: ignore
+        self.glyphs = glyphs
+        self.char_widths = {key: tuple(sorted(widths)) for key, widths in glyphs.items()}
+
+    def widths(self, mode: str, char: str) -> tuple[int, ...]:
+        '''The widths a character comes in, in ascending order. Empty if there are none.'''
+        return self.char_widths.get((mode, char), ())
+
+    def options(self, mode: str, char: str, width: int) -> list[LetterFrames]:
+        '''The three animation frames of every sprite of a character with the given width'''
+        return self.glyphs.get((mode, char), {}).get(width, [])
+
 @dataclass
 class LevelData:
     id: str
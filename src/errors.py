@@ -101,3 +101,8 @@ class MovementOutOfFrame(OperationError):
 
 class OperationNotFound(OperationError):
     '''does not exist'''
+
+# === Rendering ===
+
+class WorkerCrashed(BabaError):
+    '''A job killed the worker processes running it, twice'''
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+_MISSING: Any = object()
+
+@dataclass
+class PathRecord:
+    '''A path object of a level'''
+    x: int
+    y: int
+    obj: str
+    direction: int
+
+@dataclass
+class LevelRecord:
+    '''A level object of a level (map)'''
+    x: int
+    y: int
+    # Level colors can sometimes be omitted
+    color: tuple[int, int] | None
+    style: int
+    number: int
+    file: str | None
+
+class LevelFile:
+    '''The contents of a .ld file.
+
+    This reads the same files as `configparser.ConfigParser(strict=False)`, in a single pass:
+    Keys are case-insensitive, later values override earlier ones, sections with the same name
+    are merged and indented lines continue the value before them. Malformed lines, and lines
+    outside of any section, are skipped instead of raising an error after reading the file.
+    Values are never interpolated.
+
+    Lookups raise KeyError when the section or key is missing and no fallback is given.
+    '''
+    def __init__(self, sections: dict[str, dict[str, str]]) -> None:
+        self.sections = sections
+
+    @classmethod
+    def parse(cls, fp: Iterable[str]) -> LevelFile:
+        '''Reads a .ld file from a stream of lines.'''
+        sections: dict[str, dict[str, str]] = {}
+        section: dict[str, str] | None = None
+        # The last key, and the indentation of the last line that didn't continue a value
+        key: str | None = None
+        indent = 0
+        blank_lines = 0
+        for line in fp:
+            value = line.strip()
+            if not value:
+                blank_lines += 1
+                continue
+            if value[0] in "#;":
+                continue
+            line_indent = 0 if line[0] == value[0] else len(line) - len(line.lstrip())
+            if section is not None and key and line_indent > indent:
+                section[key] += "\n" * (blank_lines + 1) + value
+                blank_lines = 0
+                continue
+            indent = line_indent
+            if value[0] == "[":
+                end = value.rfind("]")
+                if end > 1:
+                    section = sections.setdefault(value[1:end], {})
+                    key = None
+                    continue
+            if section is None:
+                continue
+            # Split on the first delimiter
+            delimiter = value.find("=")
+            colon = value.find(":", 0, None if delimiter == -1 else delimiter)
+            if colon != -1:
+                delimiter = colon
+            elif delimiter == -1:
+                continue
+            key = value[:delimiter].rstrip().lower()
+            section[key] = value[delimiter + 1:].lstrip()
+            blank_lines = 0
+        return cls(sections)
+
+    @classmethod
+    def read(cls, path: str) -> LevelFile:
+        '''Reads a .ld file from disk.'''
+        with open(path, errors="replace", encoding="utf-8") as fp:
+            return cls.parse(fp)
+
+    def get(self, section: str, key: str, fallback: Any = _MISSING) -> Any:
+        '''The value of a key in a section, or `fallback` if it's missing'''
+        try:
+            return self.sections[section][key.lower()]
+        except KeyError:
+            if fallback is _MISSING:
+                raise
+            return fallback
+
+    def getint(self, section: str, key: str, fallback: Any = _MISSING) -> Any:
+        '''The value of a key in a section as an integer, or `fallback` if it's missing'''
+        value = self.get(section, key, None)
+        if value is None:
+            if fallback is _MISSING:
+                raise KeyError(key)
+            return fallback
+        return int(value)
+
+    def paths(self) -> list[PathRecord]:
+        '''The path objects of the level'''
+        paths = self.sections.get("paths", {})
+        return [
+            PathRecord(int(paths[f"{i}x"]), int(paths[f"{i}y"]), paths[f"{i}object"], int(paths[f"{i}dir"]))
+            for i in range(self.getint("general", "paths", fallback=0))
+        ]
+
+    def levels(self) -> list[LevelRecord]:
+        '''The level objects of the level'''
+        levels = self.sections.get("levels", {})
+        records = []
+        for i in range(self.getint("general", "levels", fallback=0)):
+            color = levels.get(f"{i}colour")
+            if color is not None:
+                c_0, c_1 = color.split(",")
+                color = int(c_0), int(c_1)
+            records.append(LevelRecord(
+                # If you can't locate it, it's fricked
+                int(levels[f"{i}x"]),
+                int(levels[f"{i}y"]),
+                color,
+                int(levels.get(f"{i}style", 0)),
+                int(levels.get(f"{i}number", 0)),
+                levels.get(f"{i}file"),
+            ))
+        return records
+
+    def specials(self) -> list[str]:
+        '''The data of the special objects of the level'''
+        specials = self.sections.get("specials", {})
+        return [specials[f"{i}data"] for i in range(self.getint("general", "specials", fallback=0))]
+
+    def icon(self, number: int) -> str | None:
+        '''The sprite of a custom level icon, if there is one'''
+        return self.sections.get("icons", {}).get(f"{number}file")
+
+    def images(self) -> list[str]:
+        '''The background images of the level'''
+        images = self.sections.get("images", {})
+        return [images[str(i)] for i in range(self.getint("images", "total", fallback=0))]
+
+    def changes(self, attrs: Iterable[str]) -> dict[str, dict[str, str]]:
+        '''The changed attributes of each changed object, e.g. `{"object001": {"image": "keke"}}`'''
+        tiles = self.sections.get("tiles", {})
+        # `changed_short` exists for some custom levels
+        changed_record = tiles.get("changed_short")
+        if changed_record is None:
+            # levels in the base game (and custom levels without `changed_short`)
+            # all provide `changed`, which CAN be an empty string
+            changed_record = self.sections["tiles"]["changed"]
+            changed_tiles = [x for x in changed_record.rstrip(",").split(",") if x != ""]
+        else:
+            changed_tiles = [f"object{x}" for x in changed_record.rstrip(",").split(",") if x != ""]
+        changes: dict[str, dict[str, str]] = {}
+        for tile in changed_tiles:
+            # Keys are stored in lowercase
+            keys = {attr: f"{tile}_{attr}".lower() for attr in attrs}
+            changes[tile] = {attr: tiles[key] for attr, key in keys.items() if key in tiles}
+        return changes
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import pathlib
+from dataclasses import dataclass
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from . import constants
+
+# A row of the `letters` table: mode, char, width and the PNG of each frame
+LetterRow = tuple[str, str, int, bytes, bytes, bytes]
+
+@dataclass
+class LetterJob:
+    '''A text sprite to scrape letters from, in a form that can be sent to a worker process.'''
+    word: str
+    text_type: int
+    # The alpha of the property text plates, in 1 bit per pixel, one for each frame
+    plates: list[Image.Image]
+
+def label(mask: np.ndarray) -> np.ndarray:
+    '''Labels the 4-connected components of a boolean mask. Background pixels are labelled 0.'''
+    height, width = mask.shape
+    labels = np.where(mask, np.arange(1, height * width + 1).reshape(height, width), 0)
+    # Every pixel takes the smallest label around it, until each component has one label
+    big = height * width + 1
+    while True:
+        padded = np.pad(np.where(mask, labels, big), 1, constant_values=big)
+        smallest = np.minimum.reduce([
+            padded[1:-1, 1:-1],
+            padded[:-2, 1:-1],
+            padded[2:, 1:-1],
+            padded[1:-1, :-2],
+            padded[1:-1, 2:],
+        ])
+        smallest = np.where(mask, smallest, 0)
+        if np.array_equal(smallest, labels):
+            return labels
+        labels = smallest
+
+def _encode(frame: Image.Image) -> bytes:
+    buf = BytesIO()
+    frame.save(buf, format="PNG")
+    return buf.getvalue()
+
+def scrape_letters(job: LetterJob) -> list[LetterRow]:
+    '''Scrapes the letters of a vanilla text sprite.
+
+    Letters are found left to right along the middle of each row of text, in each of the three frames.
+    Only letters found in all three frames are kept, and nothing is kept if the sprite runs out of letters.
+    '''
+    chars = job.word[5:] # Strip "text_" prefix
+
+    # Get the number of rows
+    two_rows = len(chars) >= 4
+
+    # Maps each character to three bounding boxes + images
+    # (One box + image for each frame of animation)
+    char_sizes: dict[tuple[int, str], list[tuple[tuple[int, int, int, int], Image.Image]]] = {}
+
+    # Scrape the sprites for the sprite characters in each of the three frames
+    for frame, plate in enumerate(job.plates):
+        # Get the alpha channel in 1-bit depth
+        with Image.open(f"data/sprites/{constants.BABA_WORLD}/{job.word}_0_{frame + 1}.png") as fp:
+            alpha = fp.convert("RGBA").getchannel("A").convert("1")
+
+        # Type-2 text has inverted text on a background plate
+        if job.text_type == 2:
+            alpha = ImageChops.invert(alpha)
+            alpha = ImageChops.logical_and(alpha, plate)
+
+        mask = np.array(alpha, dtype=bool)
+        labels = label(mask)
+        height, width = mask.shape
+
+        # Get the point from which characters are seeked for
+        x = 0
+        y = 6 if two_rows else 12
+
+        for i, char in enumerate(chars):
+            while not mask[y, x]:
+                if x == width - 1:
+                    if two_rows and y == 6:
+                        x = 0
+                        y = 18
+                    else:
+                        # Ran out of letters
+                        return []
+                else:
+                    x += 1
+            # There's a letter at this position
+            blob = labels == labels[y, x]
+            ys, xs = np.nonzero(blob)
+            x1, y1, x2, y2 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+
+            # Too tall? Scrap the rest of the characters
+            if y2 - y1 > 1.5 * height / (1 + two_rows):
+                break
+
+            # Remove character from sprite
+            mask &= ~blob
+            # too thin! bad letter.
+            if x2 - x1 <= 2:
+                continue
+
+            clone = Image.fromarray(blob[y1:y2, x1:x2])
+            char_sizes.setdefault((i, char), []).append(((int(x1), int(y1), int(x2), int(y2)), clone))
+
+    results: list[LetterRow] = []
+    mode = "small" if two_rows else "big"
+    for (_, char), entries in char_sizes.items():
+        # All three frames clearly found the character in the sprite
+        if len(entries) == 3:
+            x1_min = min(box[0] for box, _ in entries)
+            y1_min = min(box[1] for box, _ in entries)
+            x2_max = max(box[2] for box, _ in entries)
+            y2_max = max(box[3] for box, _ in entries)
+
+            blobs = []
+            for (x1, y1, _, _), img in entries:
+                frame_img = Image.new("1", (x2_max - x1_min, y2_max - y1_min))
+                frame_img.paste(img, (x1 - x1_min, y1 - y1_min))
+                blobs.append(_encode(frame_img))
+            results.append((mode, char, x2_max - x1_min, blobs[0], blobs[1], blobs[2]))
+    return results
+
+def _one_bit(im: Image.Image) -> Image.Image:
+    if im.mode == "1":
+        return im
+    elif im.mode == "RGB" or im.mode == "L":
+        return im.convert("1")
+    return im.convert("RGBA").getchannel("A").convert("1")
+
+def read_ready_letters(paths: list[str]) -> list[LetterRow]:
+    '''Reads letters drawn by hand, given the paths of their first frames in `data/letters/<mode>/<char>/<width>/`.'''
+    rows: list[LetterRow] = []
+    for path in map(pathlib.Path, paths):
+        _, _, mode, char, w, name = path.parts
+        char = char.replace("asterisk", "*")
+        prefix = name[:-6]
+        blobs = []
+        for frame in range(3):
+            with Image.open(path.parent / f"{prefix}_{frame}.png") as im:
+                blobs.append(_encode(_one_bit(im)))
+        rows.append((mode, char, int(w), blobs[0], blobs[1], blobs[2]))
+    return rows
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+from PIL import Image
+
+# Per-channel lookup tables, indexed by the color component they multiply by.
+# Alpha is passed through unchanged.
+_IDENTITY = list(range(256))
+_CHANNEL_LUTS = [[(value * factor) >> 8 for value in range(256)] for factor in range(256)]
+
+def recolor(sprite: Image.Image, rgb: tuple[int, int, int]) -> Image.Image:
+    '''Apply rgb color multiplication (0-255) to an RGBA sprite'''
+    r, g, b = rgb
+    return sprite.point(_CHANNEL_LUTS[r] + _CHANNEL_LUTS[g] + _CHANNEL_LUTS[b] + _IDENTITY)
+
+def recolor_array(arr: np.ndarray, rgb: np.ndarray | Sequence[int] | Sequence[Sequence[int]]) -> np.ndarray:
+    '''Apply rgb color multiplication (0-255) to RGBA pixel data.
+
+    `arr` has the shape `(..., height, width, 4)`. `rgb` is either a single color,
+    or one color for each image along the leading axes of `arr`.
+    '''
+    factors = np.asarray(rgb, dtype=np.uint16)
+    factors = factors.reshape(factors.shape[:-1] + (1, 1, 3))
+    out = arr.copy()
+    out[..., :3] = (arr[..., :3] * factors) >> 8
+    return out
+
+def recolor_batch(sprites: Sequence[Image.Image], rgbs: Sequence[tuple[int, int, int]]) -> list[Image.Image]:
+    '''Apply a color to each of the RGBA sprites.
+
+    Sprites of the same size are recolored together in a single operation.
+    '''
+    by_size: dict[tuple[int, int], list[int]] = {}
+    for i, sprite in enumerate(sprites):
+        by_size.setdefault(sprite.size, []).append(i)
+    out: list[Image.Image] = [None] * len(sprites) # type: ignore
+    for indices in by_size.values():
+        stacked = np.stack([np.asarray(sprites[i]) for i in indices])
+        recolored = recolor_array(stacked, [rgbs[i] for i in indices])
+        for i, arr in zip(indices, recolored):
+            out[i] = Image.fromarray(arr)
+    return out
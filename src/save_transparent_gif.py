@@ -5,102 +5,96 @@
 # transparent pixels with black pixels (among other issues) when the GIF is saved using PIL.Image.save().
 # This code works around the issue and allows us to properly generate transparent GIFs.
 
-from typing import Tuple, List, Union
-from collections import defaultdict
-from random import randrange
+from typing import Optional, Set, Tuple, List, Union
 from itertools import chain
 
-from PIL.Image import Image
+import numpy as np
+from PIL.Image import Image, fromarray
 
 
-class TransparentAnimatedGifConverter(object):
-    _PALETTE_SLOTSET = set(range(256))
+def _first_unused_color(used_colors: Set[tuple]) -> tuple:
+    """Return the first RGB color, counting up from black, that isn't one of `used_colors`.
+
+    Picking it the same way every time keeps identical images encoding to identical bytes."""
+    for value in range(len(used_colors) + 1):
+        color = (value >> 16, (value >> 8) & 0xFF, value & 0xFF)
+        if color not in used_colors:
+            return color
+    raise AssertionError("unreachable")
+
 
+class TransparentAnimatedGifConverter(object):
     def __init__(self, img_rgba: Image, alpha_threshold: int = 0):
         self._img_rgba = img_rgba
         self._alpha_threshold = alpha_threshold
 
     def _process_pixels(self):
-        """Set the transparent pixels to the color 0."""
-        self._transparent_pixels = set(
-            idx for idx, alpha in enumerate(
-                self._img_rgba.getchannel(channel='A').getdata())
-            if alpha <= self._alpha_threshold)
+        """Find the transparent pixels, which will be set to the color 0."""
+        alpha = np.asarray(self._img_rgba.getchannel(channel='A'))
+        self._transparent_pixels = alpha <= self._alpha_threshold
 
     def _set_parsed_palette(self):
-        """Parse the RGB palette color `tuple`s from the palette."""
-        palette = self._img_p.getpalette()
-        self._img_p_used_palette_idxs = set(
-            idx for pal_idx, idx in enumerate(self._img_p_data)
-            if pal_idx not in self._transparent_pixels)
-        self._img_p_parsedpalette = dict(
-            (idx, tuple(palette[idx * 3:idx * 3 + 3]))
-            for idx in self._img_p_used_palette_idxs)
+        """Parse the RGB palette colors, and find which of them are used."""
+        palette = self._img_p.getpalette() or []
+        self._img_p_palette = np.zeros((256, 3), dtype=np.uint8)
+        self._img_p_palette.flat[:len(palette)] = palette[:768]
+        self._img_p_used_palette_idxs = np.zeros(256, dtype=bool)
+        self._img_p_used_palette_idxs[self._img_p_data[~self._transparent_pixels]] = True
+        # The palette indices whose color is set in the final palette
+        self._img_p_parsed_idxs = self._img_p_used_palette_idxs.copy()
 
     def _get_similar_color_idx(self):
         """Return a palette index with the closest similar color."""
-        old_color = self._img_p_parsedpalette[0]
-        dict_distance = defaultdict(list)
-        for idx in range(1, 256):
-            color_item = self._img_p_parsedpalette[idx]
-            if color_item == old_color:
-                return idx
-            distance = sum((
-                abs(old_color[0] - color_item[0]),  # Red
-                abs(old_color[1] - color_item[1]),  # Green
-                abs(old_color[2] - color_item[2])))  # Blue
-            dict_distance[distance].append(idx)
-        return dict_distance[sorted(dict_distance)[0]][0]
+        distances = np.abs(
+            self._img_p_palette[1:].astype(np.int16) - self._img_p_palette[0]
+        ).sum(axis=1)
+        # Ties go to the lowest index, and an identical color has a distance of 0
+        return int(distances.argmin()) + 1
 
     def _remap_palette_idx_zero(self):
         """Since the first color is used in the palette, remap it."""
-        free_slots = self._PALETTE_SLOTSET - self._img_p_used_palette_idxs
-        new_idx = free_slots.pop() if free_slots else \
+        free_slots = np.flatnonzero(~self._img_p_used_palette_idxs)
+        new_idx = int(free_slots[0]) if len(free_slots) else \
             self._get_similar_color_idx()
-        self._img_p_used_palette_idxs.add(new_idx)
+        self._img_p_used_palette_idxs[new_idx] = True
         self._palette_replaces['idx_from'].append(0)
         self._palette_replaces['idx_to'].append(new_idx)
-        self._img_p_parsedpalette[new_idx] = self._img_p_parsedpalette[0]
-        del(self._img_p_parsedpalette[0])
+        self._img_p_palette[new_idx] = self._img_p_palette[0]
+        self._img_p_parsed_idxs[new_idx] = True
+        self._img_p_parsed_idxs[0] = False
 
     def _get_unused_color(self) -> tuple:
         """ Return a color for the palette that does not collide with any other already in the palette."""
-        used_colors = set(self._img_p_parsedpalette.values())
-        while True:
-            new_color = (randrange(256), randrange(256), randrange(256))
-            if new_color not in used_colors:
-                return new_color
+        used_colors = set(map(tuple, self._img_p_palette[self._img_p_parsed_idxs].tolist()))
+        return _first_unused_color(used_colors)
 
     def _process_palette(self):
         """Adjust palette to have the zeroth color set as transparent. Basically, get another palette
         index for the zeroth color."""
         self._set_parsed_palette()
-        if 0 in self._img_p_used_palette_idxs:
+        if self._img_p_used_palette_idxs[0]:
             self._remap_palette_idx_zero()
-        self._img_p_parsedpalette[0] = self._get_unused_color()
+        self._img_p_palette[0] = self._get_unused_color()
+        self._img_p_parsed_idxs[0] = True
 
     def _adjust_pixels(self):
         """Convert the pixels into their new values."""
         if self._palette_replaces['idx_from']:
-            trans_table = bytearray.maketrans(
-                bytes(self._palette_replaces['idx_from']),
-                bytes(self._palette_replaces['idx_to']))
-            self._img_p_data = self._img_p_data.translate(trans_table)
-        for idx_pixel in self._transparent_pixels:
-            self._img_p_data[idx_pixel] = 0
-        self._img_p.frombytes(data=bytes(self._img_p_data))
+            trans_table = np.arange(256, dtype=np.uint8)
+            trans_table[self._palette_replaces['idx_from']] = self._palette_replaces['idx_to']
+            self._img_p_data = trans_table[self._img_p_data]
+        self._img_p_data[self._transparent_pixels] = 0
+        self._img_p.frombytes(data=self._img_p_data.tobytes())
 
     def _adjust_palette(self):
         """Modify the palette in the new `Image`."""
-        unused_color = self._get_unused_color()
-        final_palette = chain.from_iterable(
-            self._img_p_parsedpalette.get(x, unused_color) for x in range(256))
-        self._img_p.putpalette(data=final_palette)
+        self._img_p_palette[~self._img_p_parsed_idxs] = self._get_unused_color()
+        self._img_p.putpalette(data=self._img_p_palette.tobytes())
 
     def process(self) -> Image:
         """Return the processed mode `P` `Image`."""
         self._img_p = self._img_rgba.convert(mode='P')
-        self._img_p_data = bytearray(self._img_p.tobytes())
+        self._img_p_data = np.array(self._img_p)
         self._palette_replaces = dict(idx_from=list(), idx_to=list())
         self._process_pixels()
         self._process_palette()
@@ -117,8 +111,7 @@ def _create_animated_gif(images: List[Image], durations: Union[int, List[int]])
     new_images: List[Image] = []
 
     for frame in images:
-        thumbnail = frame.copy()  # type: Image
-        thumbnail_rgba = thumbnail.convert(mode='RGBA')
+        thumbnail_rgba = frame.convert(mode='RGBA')
         thumbnail_rgba.thumbnail(size=frame.size, reducing_gap=3.0)
         converter = TransparentAnimatedGifConverter(img_rgba=thumbnail_rgba)
         thumbnail_p = converter.process()  # type: Image
@@ -136,6 +129,63 @@ def _create_animated_gif(images: List[Image], durations: Union[int, List[int]])
     return output_image, save_kwargs
 
 
+# Maps 24-bit RGB values to palette indices. It's large, so it is allocated once, and every
+# entry is set back to 0 after use
+_rgb_to_index = np.zeros(1 << 24, dtype=np.uint8)
+
+
+def _create_global_palette_gif(images: List[Image], durations: Union[int, List[int]],
+                               alpha_threshold: int = 0) -> Optional[Tuple[Image, dict]]:
+    """Create a GIF whose frames all share one palette, holding exactly the colors of the frames.
+
+    Frames are mapped onto the palette with a lookup table instead of being quantized. Returns
+    `None` if the frames use too many colors to fit in a single palette, or differ in size."""
+    if len(set(frame.size for frame in images)) != 1:
+        return None
+    frames_rgba = [frame if frame.mode == 'RGBA' else frame.convert(mode='RGBA') for frame in images]
+    # Palette index 0 is reserved for transparency
+    colors = set()
+    for frame in frames_rgba:
+        frame_colors = frame.getcolors(maxcolors=256)
+        if frame_colors is None:
+            return None
+        colors.update(color[:3] for _, color in frame_colors if color[3] > alpha_threshold)
+        if len(colors) > 255:
+            return None
+    palette = sorted(colors)
+    transparent_color = _first_unused_color(colors)
+    palette_data = bytes(chain.from_iterable([transparent_color] + palette))
+
+    # Pixels are read as little-endian 32-bit integers, so their RGB part is the low 24 bits
+    rgb_mask = np.uint32(0xFFFFFF)
+    keys = np.array(palette, dtype=np.uint32).reshape(-1, 3) @ np.array([1, 1 << 8, 1 << 16], dtype=np.uint32)
+    _rgb_to_index[keys] = np.arange(1, len(palette) + 1, dtype=np.uint8)
+    new_images: List[Image] = []
+    try:
+        for frame in frames_rgba:
+            pixels = np.asarray(frame)
+            indices = _rgb_to_index[pixels.view('<u4')[..., 0] & rgb_mask]
+            indices[pixels[..., 3] <= alpha_threshold] = 0
+            frame_p = fromarray(indices, mode='P')
+            frame_p.putpalette(data=palette_data)
+            frame_p.info['transparency'] = 0
+            frame_p.info['background'] = 0
+            new_images.append(frame_p)
+    finally:
+        _rgb_to_index[keys] = 0
+
+    output_image = new_images[0]
+    save_kwargs = dict(
+        format='GIF',
+        save_all=True,
+        optimize=False,
+        append_images=new_images[1:],
+        duration=durations,
+        disposal=2,  # Other disposals don't work
+        loop=0)
+    return output_image, save_kwargs
+
+
 def save_transparent_gif(images: List[Image], durations: Union[int, List[int]], save_file):
     """Creates a transparent GIF, adjusting to avoid transparency issues that are present in the PIL library
 
@@ -149,5 +199,9 @@ def save_transparent_gif(images: List[Image], durations: Union[int, List[int]],
     Returns:
         Image - The PIL Image object (after first saving the image to the specified target)
     """
-    root_frame, save_args = _create_animated_gif(images, durations)
+    # Renders use few colors, so a single shared palette can usually be used instead of quantizing each frame
+    created = _create_global_palette_gif(images, durations)
+    if created is None:
+        created = _create_animated_gif(images, durations)
+    root_frame, save_args = created
     root_frame.save(save_file, **save_args)
\ No newline at end of file
@@ -20,3 +20,11 @@ class Event:
 class CogRefreshEvent(Event):
     '''A cog refresh has been requested by one of the instances.'''
     cog: str | None
+
+@dataclass
+class TileDataRefreshEvent(Event):
+    '''Tile data or sprites have been changed by one of the instances.'''
+
+@dataclass
+class LetterDataRefreshEvent(Event):
+    '''The letters used for custom text have been changed by one of the instances.'''
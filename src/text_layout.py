@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+
+from . import constants, errors
+
+@dataclass(frozen=True)
+class TextLayout:
+    '''Where the letters of a custom text sprite go'''
+    # The width of each letter
+    widths: tuple[int, ...]
+    # The first letter on the second row, -1 for a single row
+    index: int
+    # The gap before each letter. The first gap of a row is its left margin.
+    gaps: tuple[int, ...]
+
+def layout_text(text: str, mode: str, available: tuple[tuple[int, ...], ...]) -> TextLayout:
+    '''Lays out custom text, making letters as wide as possible without squishing them.
+
+    `text` is the text without its `text_` prefix, with "/" marking a fixed line break.
+    `available` holds the widths each letter comes in, in ascending order.
+    Raises CustomTextTooLong or BadCharacter if the text can't be laid out.
+    '''
+    raw = text.replace("/", "")
+    fixed = "/" in text
+    if fixed:
+        index = text.index("/")
+    elif mode == "small":
+        index = len(raw) - len(raw) // 2
+    else:
+        index = -1
+
+    def width_greater_than(i: int, w: int = 0) -> int:
+        for width in available[i]:
+            if width > w:
+                return width
+        raise KeyError(raw[i])
+
+    # fetch the minimum possible widths first
+    try:
+        widths = [width_greater_than(i) for i in range(len(raw))]
+    except KeyError as e:
+        raise errors.BadCharacter(text, mode, e.args[0])
+
+    max_width = constants.DEFAULT_SPRITE_SIZE
+    def check_or_adjust(widths: list[int], index: int) -> int:
+        '''Is the arrangement valid?'''
+        if mode == "small":
+            top, bottom = sum(widths[:index]), sum(widths[index:])
+            if fixed:
+                if top > max_width or bottom > max_width:
+                    raise errors.CustomTextTooLong(text)
+            else:
+                if top + bottom > 2 * max_width:
+                    raise errors.CustomTextTooLong(text)
+                while top > max_width:
+                    index -= 1
+                    top -= widths[index]
+                    bottom += widths[index]
+                while bottom > max_width:
+                    top += widths[index]
+                    bottom -= widths[index]
+                    index += 1
+                if top > max_width or bottom > max_width:
+                    raise errors.CustomTextTooLong(text)
+                if index == 0 or index == len(raw):
+                    raise errors.CustomTextTooLong(text)
+                return index
+        else:
+            if sum(widths) > max_width:
+                raise errors.CustomTextTooLong(text)
+        return index
+
+    def too_squished(widths: list[int], index: int) -> bool:
+        '''Is the arrangement too squished? (bad letter spacing)'''
+        if mode == "small":
+            top_gaps = max_width - sum(widths[:index])
+            bottom_gaps = max_width - sum(widths[index:])
+            return top_gaps < index - 1 or bottom_gaps < len(widths) - index - 1
+        else:
+            gaps = max_width - sum(widths)
+            return gaps < len(widths) - 1
+
+    # Check if the arrangement is valid with minimum sizes
+    # If allowed, shift the index to make the arrangement valid
+    index = check_or_adjust(widths, index)
+
+    # Expand widths where possible
+    stable = [False] * len(widths)
+    while not all(stable):
+        old_width, i = min((w, i) for i, w in enumerate(widths) if not stable[i])
+        try:
+            new_width = width_greater_than(i, old_width)
+        except KeyError:
+            stable[i] = True
+            continue
+        widths[i] = new_width
+        try:
+            index = check_or_adjust(widths, index)
+        except errors.CustomTextTooLong:
+            widths[i] = old_width
+            stable[i] = True
+        else:
+            if too_squished(widths, index):
+                # We've shown that a "perfect" width already exists below this
+                # So stick to the "perfect" one
+                widths[i] = old_width
+                stable[i] = True
+
+    # Arrangement is now the widest it can be
+    # Kerning: try for 1 pixel between sprites, and rest to the edges
+    gaps: list[int] = []
+    if mode == "small":
+        rows = [widths[:index], widths[index:]]
+    else:
+        rows = [widths]
+    for row in rows:
+        space = max_width - sum(row)
+        # Extra -1 is here to not give kerning space outside the left/rightmost char
+        chars = len(row) - 1
+        if space >= chars:
+            # left edge
+            gaps.append((space - chars) // 2)
+            # char gap
+            gaps.extend([1] * chars)
+            # right edge gap is implied
+        else:
+            # left edge
+            gaps.append(0)
+            # as many char gaps as possible, starting from the left
+            gaps.extend([1] * space)
+            gaps.extend([0] * (chars - space))
+    return TextLayout(tuple(widths), index, tuple(gaps))
+
+def letter_seed(text: str, position: tuple[int, int], wobble: int, seed: int) -> int:
+    '''A seed for picking the letters of custom text, the same for the same text, position, frame and `seed`'''
+    x, y = position
+    # One byte for each letter
+    digest = hashlib.blake2b(f"{text}:{x}:{y}:{wobble}:{seed}".encode(), digest_size=constants.MAX_TEXT_LENGTH)
+    return int.from_bytes(digest.digest(), "little")
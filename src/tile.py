@@ -9,6 +9,7 @@ from PIL import Image
 from . import errors
 
 if TYPE_CHECKING:
+    from .db import TileData
     _T = TypeVar("_T")
     Grid = dict[tuple[int, int, int], list[_T]]
 else:
@@ -80,6 +81,7 @@ class TileFields(TypedDict, total=False):
     cut_alpha: bool
     face: bool
     blank: bool
+    tile_data: TileData
 
 @dataclass
 class FullTile(SkeletonTile):
@@ -99,6 +101,7 @@ class FullTile(SkeletonTile):
     cut_alpha: bool = False
     face: bool = False
     blank: bool = False
+    tile_data: TileData | None = None
     
     @classmethod
     def from_tile_fields(cls, tile: RawTile, fields: TileFields) -> FullTile:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from src.constants import BABA_WORLD
 
-from typing import Callable, Dict, List, Literal, Optional, TextIO, Tuple, TypeVar, overload
+from typing import Dict, List, Literal, Optional, TextIO, Tuple, TypeVar, overload
 from PIL import Image
 
 class Tile:
@@ -31,11 +31,3 @@ class Tile:
         if self.custom:
             return f"<Custom tile {self.name}>"
         return f"<Tile {self.name} : {self.variant} with {self.color} from {self.source}>"
-
-T = TypeVar("T")
-def cached_open(path, *, cache: dict[str, T], fn: Callable[[str], T] = open) -> T:
-    '''Checks whether a path is in the cache, and if so, returns that element. Otherwise calls the function on the path.'''
-    if path in cache:
-        return cache[path]
-    cache[path] = result = fn(path)
-    return result
\ No newline at end of file
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+from . import cache, constants, errors
+from .db import Database, LevelData
+from .tile import FullTile, Grid
+
+if TYPE_CHECKING:
+    from .cogs.reader import Reader
+    from .cogs.render import Renderer
+
+T = TypeVar("T")
+
+def _tile_fields(tile: FullTile) -> list[Any]:
+    '''The fields of a tile as plain values, in the order they are declared in'''
+    fields = vars(tile).copy()
+    if tile.tile_data is not None:
+        fields["tile_data"] = list(vars(tile.tile_data).values())
+    return list(fields.values())
+
+@dataclass
+class RenderJob:
+    '''Everything needed to render a scene, in a form that can be sent to a worker process.'''
+    grid: Grid[FullTile]
+    grid_size: tuple[int, int]
+    duration: int
+    palette: str = "default"
+    background: tuple[int, int] | None = None
+    delay: int = 200
+    frame_count: int = 3
+    upscale: bool = True
+    random_animations: bool = True
+    # Custom text picks its letters at random if None, otherwise the same way every time for this seed
+    seed: int | None = None
+    # If given, the frames are also zipped, with this name
+    extra_name: str | None = None
+
+    def digest(self) -> str:
+        '''A digest of everything that affects the render, the same for jobs that render the same scene'''
+        # Only plain values, written the same way every time. Grids built in a different order are the same scene
+        canonical = {
+            "grid": [
+                [list(position), [_tile_fields(tile) for tile in stack]]
+                for position, stack in sorted(self.grid.items(), key=lambda item: item[0])
+            ],
+            "grid_size": list(self.grid_size),
+            "duration": self.duration,
+            "palette": self.palette,
+            "background": self.background,
+            "delay": self.delay,
+            "frame_count": self.frame_count,
+            "upscale": self.upscale,
+            "random_animations": self.random_animations,
+            "seed": self.seed,
+            "extra_name": self.extra_name,
+        }
+        encoded = json.dumps(canonical, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    @property
+    def deterministic(self) -> bool:
+        '''Whether the scene comes out the same every time it's rendered. Unseeded custom text is randomized.'''
+        if self.seed is not None:
+            return True
+        return not any(tile.custom for stack in self.grid.values() for tile in stack)
+
+@dataclass
+class RenderResult:
+    '''A rendered scene'''
+    gif: bytes
+    extra: bytes | None = None
+
+@dataclass
+class LevelJob:
+    '''A level of a world to be read and rendered to `target/renders/<source>/<filename>.gif`.'''
+    filename: str
+    source: str
+    initialize: bool = False
+    remove_borders: bool = False
+    keep_background: bool = False
+    # Digests of input files that are already known, which aren't read again
+    digests: dict[str, str | None] = field(default_factory=dict)
+
+@dataclass
+class LevelResult:
+    '''A rendered level'''
+    metadata: LevelData
+    # The level's node in the level tree, if it was initialized and has child levels
+    parent_level: tuple[str, dict[str, tuple[int, int]]] | None = None
+    # SHA-256 digests of the files the render depends on, None for files that don't exist
+    inputs: dict[str, str | None] = field(default_factory=dict)
+
+# The code that turns render jobs and levels into pixels: the renderer, the reader, and every module of
+# this package that they import. A new module imported by any of them must be added here
+_RENDERER_FILES = (
+    "cogs/reader.py",
+    "cogs/render.py",
+    "cache.py",
+    "compositor.py",
+    "constants.py",
+    "db.py",
+    "errors.py",
+    "ld.py",
+    "recolor.py",
+    "save_transparent_gif.py",
+    "text_layout.py",
+    "tile.py",
+    "workers.py",
+)
+
+def renderer_version() -> str:
+    '''A digest of the renderer's code, which changes when it could render scenes differently'''
+    digest = hashlib.sha256()
+    for name in _RENDERER_FILES:
+        with open(os.path.join(os.path.dirname(__file__), name), "rb") as fp:
+            digest.update(fp.read())
+    return digest.hexdigest()[:16]
+
+class _WorkerBot:
+    '''The parts of the bot that the renderer and reader use'''
+    renderer: Renderer
+    def __init__(self, db: Database) -> None:
+        self.db = db
+
+# State of a worker process
+_loop: asyncio.AbstractEventLoop
+_bot: _WorkerBot
+_reader: Reader | None = None
+
+def _initialize(db_path: str) -> None:
+    '''Sets up a worker process with its own event loop, database connection and renderer.'''
+    global _loop, _bot
+    # Imported here so that workers use the renderer as it was when they were started
+    from .cogs.render import Renderer
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    db = Database()
+    _loop.run_until_complete(db.connect(db_path))
+    _bot = _WorkerBot(db)
+    _bot.renderer = Renderer(_bot) # type: ignore
+
+def _ready() -> None:
+    '''Does nothing. Used to start the worker processes ahead of time.'''
+
+def _render(job: RenderJob) -> RenderResult:
+    return _loop.run_until_complete(_bot.renderer.render_job(job))
+
+def _bake_level(job: LevelJob) -> LevelResult:
+    global _reader
+    if _reader is None:
+        # Only workers that render levels need to read the object data
+        from .cogs.reader import Reader
+        _reader = Reader(_bot) # type: ignore
+    return _loop.run_until_complete(_reader.bake_level(job))
+
+def _load_stored(stored_key: str, job: RenderJob) -> RenderResult | None:
+    '''A render stored on disk, if both of its files are there'''
+    gif = cache.stored_renders.get(stored_key + ".gif")
+    if gif is None:
+        return None
+    extra = None
+    if job.extra_name is not None:
+        extra = cache.stored_renders.get(stored_key + ".zip")
+        if extra is None:
+            return None
+    return RenderResult(gif, extra)
+
+def _store(stored_key: str, result: RenderResult) -> None:
+    cache.stored_renders.put(stored_key + ".gif", result.gif)
+    if result.extra is not None:
+        cache.stored_renders.put(stored_key + ".zip", result.extra)
+
+class RenderPool:
+    '''Renders scenes and levels, and runs other heavy jobs, in worker processes, so that the event loop isn't blocked by them.
+
+    With a size of 0, they are rendered in the calling process instead.
+    '''
+    def __init__(self, size: int, db_path: str) -> None:
+        self.size = size
+        self.db_path = db_path
+        self.executor: ProcessPoolExecutor | None = None
+        # Counts the sets of workers started, so that a failure is only handled once
+        self.generation = 0
+        self.version = renderer_version()
+
+    def start(self, *, wait: bool = False) -> None:
+        '''Starts the worker processes.
+
+        Workers are spawned as fresh interpreters, which import the renderer as it is on disk,
+        so the main module must only start the bot under an `if __name__ == "__main__":` guard.
+        If `wait` is set, this blocks until every worker is running.
+        '''
+        if self.size <= 0:
+            return
+        self.executor = ProcessPoolExecutor(
+            self.size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize,
+            initargs=(self.db_path,)
+        )
+        self.generation += 1
+        if wait:
+            for future in [self.executor.submit(_ready) for _ in range(self.size)]:
+                future.result()
+
+    def stop(self) -> None:
+        '''Stops the worker processes. Renders already submitted are finished first.'''
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def restart(self) -> None:
+        '''Replaces the worker processes, e.g. after their code or data has changed.'''
+        # Scenes rendered before might look different now
+        cache.renders.clear()
+        self.version = renderer_version()
+        self.stop()
+        self.start()
+
+    async def run(self, fn: Callable[[Any], T], job: Any, fallback: Callable[[Any], Awaitable[T]]) -> T:
+        '''Runs `fn(job)` in a worker process, or `fallback(job)` in this process if there are no workers.
+
+        If a worker dies while running the job, the job is tried once more on new workers.
+        Raises WorkerCrashed if it kills those too.
+        '''
+        if self.executor is None:
+            return await fallback(job)
+        for attempt in range(2):
+            assert self.executor is not None
+            generation = self.generation
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, fn, job)
+            except BrokenProcessPool as e:
+                # A worker died abruptly. Every job running on the broken workers fails with it,
+                # but only the first failure replaces them
+                if self.generation == generation:
+                    self.restart()
+                if attempt == 1:
+                    # Most likely this job killed them, running it here would take down the bot
+                    raise errors.WorkerCrashed() from e
+        raise AssertionError("unreachable")
+
+    async def call(self, fn: Callable[[Any], T], job: Any) -> T:
+        '''Runs a function that doesn't need the bot's state in a worker process, or in this process if there are no workers.'''
+        async def fallback(job: Any) -> T:
+            return fn(job)
+        return await self.run(fn, job, fallback)
+
+    async def render(self, renderer: Renderer, job: RenderJob) -> RenderResult:
+        '''Renders a scene in a worker process, or with `renderer` if there are no workers.
+
+        Identical scenes share one render while it is running, and its result for
+        `constants.RENDER_CACHE_TTL` seconds after that. Scenes that come out the same
+        every time are also stored on disk, for as long as the renderer's code doesn't change.
+        '''
+        key = job.digest()
+        cached = cache.renders.get(key)
+        if cached is not None:
+            expires, result = cached
+            if time.monotonic() < expires:
+                return result
+        return await cache.render_flights.run(key, lambda: self._render(renderer, job, key))
+
+    async def _render(self, renderer: Renderer, job: RenderJob, key: str) -> RenderResult:
+        stored_key = f"{self.version}/{key[:2]}/{key}"
+        result = await asyncio.to_thread(_load_stored, stored_key, job) if job.deterministic else None
+        if result is None:
+            result = await self.run(_render, job, renderer.render_job)
+            if job.deterministic:
+                await asyncio.to_thread(_store, stored_key, result)
+        cache.renders.put(key, (time.monotonic() + constants.RENDER_CACHE_TTL, result))
+        return result
+
+    async def bake_level(self, reader: Reader, job: LevelJob) -> LevelResult:
+        '''Reads and renders a level in a worker process, or with `reader` if there are no workers.'''
+        return await self.run(_bake_level, job, reader.bake_level)